@@ -1,9 +1,22 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
 from app import db
-from models import User, Ticket, AuditLog
-from forms import ProfileForm, UserPermissionsForm
+from models import User, Ticket
+from forms import BulkTicketForm, ProfileForm, UserPermissionsForm
+from listing import list_tickets, parse_filters
+from bulk import bulk_update, parse_changes, selection
+from archive import ArchiveConflict, restore
+from changelog import current_version
+from audit import ACTIONS, audit, changed_fields, list_audit_logs
+from permissions import LEGACY_FLAGS
+from instrumentation import query_budget
+from database import read_only
+from realtime import emit_bulk_progress
+from jobs import enqueue
+from analytics import GROUP_COLUMNS, breakdown, parse_day, status_counts
+from identity import identity_cache
 from functools import wraps
+import uuid
 
 admin = Blueprint('admin', __name__)
 
@@ -17,11 +30,17 @@ def admin_required(func):
     return decorated_view
 
 @admin.route('/dashboard')
+@read_only
 @login_required
 @admin_required
 def dashboard():
-    tickets = Ticket.query.order_by(Ticket.created_at.desc()).all()
-    return render_template('admin_dashboard.html', tickets=tickets)
+    version = current_version(current_user)
+    try:
+        page = list_tickets(current_user, request.args)
+    except ValueError:
+        abort(400)
+    return render_template('admin_dashboard.html', tickets=page.tickets, page=page, version=version,
+                           bulk_form=BulkTicketForm())
 
 @admin.route('/ticket/<int:ticket_id>/edit', methods=['GET','POST'])
 @login_required
@@ -31,12 +50,87 @@ def edit_ticket(ticket_id):
     if request.method == 'POST':
         ticket.status = request.form.get('status', ticket.status)
         ticket.priority = request.form.get('priority', ticket.priority)
-        ticket.assigned_to = request.form.get('assigned_to', ticket.assigned_to)
+        if 'assigned_to' in request.form:
+            assigned_to = request.form['assigned_to'].strip()
+            ticket.assigned_to = int(assigned_to) if assigned_to.isdigit() else None
+        changes = changed_fields(ticket, ('status', 'priority', 'assigned_to'))
+        if changes:
+            enqueue('realtime.ticket_event', action='updated', ticket_id=ticket.id)
         db.session.commit()
+        if changes:
+            audit('ticket.update', target=ticket, details=changes)
         flash('Ticket updated successfully.')
         return redirect(url_for('admin.dashboard'))
     return render_template('ticket_edit.html', ticket=ticket)
 
+@admin.route('/ticket/<int:ticket_id>/restore', methods=['POST'])
+@login_required
+@admin_required
+def restore_ticket(ticket_id):
+    try:
+        restored = restore([ticket_id])
+    except ArchiveConflict as exc:
+        abort(409, description=str(exc))
+    if not restored:
+        abort(404)
+    audit('ticket.restore', target=('ticket', ticket_id))
+    flash('Ticket restored from the archive.')
+    return redirect(url_for('routes.ticket_detail', ticket_id=ticket_id))
+
+@admin.route('/tickets/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_tickets():
+    """Change status/priority/assignee of many tickets at once.
+
+    Takes JSON ``{"ids": [...]}`` or ``{"filters": {...}}`` plus the changes,
+    or the dashboard's CSRF-protected bulk form (changes in the body, the
+    list's current filters in the query string). Without filters every
+    ticket matches, so that needs ``"all": true`` (or the form's checkbox).
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    wants_json = isinstance(data, dict)
+    if not wants_json:
+        if request.is_json:
+            return jsonify(error='Expected a JSON object.'), 400
+        form = BulkTicketForm()
+        if not form.validate_on_submit():
+            flash('The form has expired, please try again.')
+            return redirect(url_for('admin.dashboard'))
+        data = request.form
+    try:
+        changes = parse_changes(data)
+        if wants_json and data.get('ids') is not None:
+            ids = [int(ticket_id) for ticket_id in data['ids']]
+            query = selection(ids=ids)
+            selected = {'ids': ids}
+        else:
+            if wants_json:
+                args = {name: str(value) for name, value in (data.get('filters') or {}).items()}
+            else:
+                args = request.args
+            filters = parse_filters(args, current_user)
+            selected = {'filters': filters}
+            confirmed = data.get('all') is True if wants_json else form.all.data
+            if not filters and not confirmed:
+                raise ValueError('Select some tickets with filters, or confirm updating every ticket.')
+            query = selection(filters=filters)
+    except (TypeError, ValueError) as exc:
+        if wants_json:
+            return jsonify(error=str(exc)), 400
+        flash(str(exc))
+        return redirect(url_for('admin.dashboard'))
+
+    operation = data.get('operation') or uuid.uuid4().hex
+    user_id = current_user.id
+    result = bulk_update(query, changes, progress=lambda done, total, updated: emit_bulk_progress(
+        user_id, operation, done, total, updated))
+    audit('ticket.bulk_update', details=dict(selected, changes=changes, **result))
+    if wants_json:
+        return jsonify(dict(result, operation=operation))
+    flash(f"Updated {result['updated']} of {result['matched']} matching tickets.")
+    return redirect(url_for('admin.dashboard', **selected.get('filters', {})))
+
 @admin.route('/users')
 @login_required
 @admin_required
@@ -68,8 +162,10 @@ def delete_user(user_id):
     if user.id == current_user.id:
         flash('Cannot delete yourself.')
         return redirect(url_for('admin.user_management'))
+    user_id, username = user.id, user.username
     db.session.delete(user)
     db.session.commit()
+    audit('user.delete', target=('user', user_id), details={'username': username})
     flash('User deleted.')
     return redirect(url_for('admin.user_management'))
 
@@ -85,29 +181,56 @@ def update_permissions(user_id):
         user.can_reply_ticket = form.can_reply_ticket.data
         user.can_edit_ticket = form.can_edit_ticket.data
         user.can_delete_ticket = form.can_delete_ticket.data
+        changes = changed_fields(user, LEGACY_FLAGS)
         db.session.commit()
-        from models import AuditLog
-        audit = AuditLog(user_id=current_user.id, action=f"Updated permissions for user {user.username}")
-        db.session.add(audit)
-        db.session.commit()
+        if changes:
+            audit('permissions.update', target=user, details=changes)
         flash('User permissions updated successfully.')
         return redirect(url_for('admin.user_management'))
     return render_template('update_permissions.html', form=form, user=user)
 
 @admin.route('/audit_logs')
+@read_only
 @login_required
 @admin_required
+@query_budget(6)
 def audit_logs():
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).all()
-    return render_template('audit_logs.html', logs=logs)
+    try:
+        logs, next_cursor, filters = list_audit_logs(request.args)
+    except ValueError:
+        abort(400)
+    return render_template('audit_logs.html', logs=logs, next_cursor=next_cursor,
+                           filters=filters, actions=ACTIONS)
+
+@admin.route('/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify({'identity': identity_cache.stats()})
 
 @admin.route('/analytics_data')
+@read_only
 @login_required
 @admin_required
 def analytics_data():
-    data = {
-        'open': Ticket.query.filter_by(status='open').count(),
-        'in_progress': Ticket.query.filter_by(status='in progress').count(),
-        'closed': Ticket.query.filter_by(status='closed').count(),
-    }
-    return jsonify(data)
+    group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+    if not group_by:
+        counts = status_counts()
+        return jsonify({
+            'open': counts.get('open', 0),
+            'in_progress': counts.get('in progress', 0),
+            'closed': counts.get('closed', 0),
+        })
+    if len(group_by) > 2 or any(name not in GROUP_COLUMNS for name in group_by):
+        abort(400)
+    try:
+        since = parse_day(request.args.get('since'))
+        until = parse_day(request.args.get('until'))
+    except ValueError:
+        abort(400)
+    return jsonify({
+        'group_by': group_by,
+        'since': since.isoformat() if since else None,
+        'until': until.isoformat() if until else None,
+        'results': breakdown(group_by, since, until),
+    })
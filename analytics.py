@@ -0,0 +1,138 @@
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, insert, inspect, select, union_all
+
+from app import db
+from database import upsert
+from models import ArchivedTicket, Ticket, TicketStat
+
+GROUP_COLUMNS = {
+    'status': TicketStat.status,
+    'priority': TicketStat.priority,
+    'assignee': TicketStat.assigned_to,
+    'day': TicketStat.day,
+}
+TRACKED_FIELDS = ('status', 'priority', 'assigned_to')
+GROUP_INDEX = next(index for index in TicketStat.__table__.indexes if index.name == 'uq_ticket_stat_group')
+
+
+def _assignee(value):
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def group_key(day, status, priority, assigned_to):
+    return day, status, priority, _assignee(assigned_to)
+
+
+def ticket_key(ticket):
+    created_at = ticket.created_at or datetime.utcnow()
+    return group_key(created_at.date(), ticket.status, ticket.priority, ticket.assigned_to)
+
+
+def adjust(connection, key, delta):
+    """Add ``delta`` to the counter for ``key`` inside the caller's transaction."""
+    day, status, priority, assigned_to = key
+    connection.execute(
+        upsert(connection, TicketStat)
+        .values(day=day, status=status, priority=priority, assigned_to=assigned_to, count=delta)
+        .on_conflict_do_update(index_elements=GROUP_INDEX.expressions, set_={'count': TicketStat.count + delta})
+    )
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# active_history loads the old value when a field of an expired ticket is
+# set, so after_update can tell which group the ticket left
+for _field in TRACKED_FIELDS:
+    event.listen(getattr(Ticket, _field), 'set', _keep_old_value, active_history=True)
+
+
+@event.listens_for(Ticket, 'after_insert')
+def _ticket_inserted(mapper, connection, ticket):
+    adjust(connection, ticket_key(ticket), 1)
+
+
+@event.listens_for(Ticket, 'after_update')
+def _ticket_updated(mapper, connection, ticket):
+    state = inspect(ticket)
+    old = {}
+    for field in TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes() and history.deleted:
+            old[field] = history.deleted[0]
+    previous = group_key(ticket_key(ticket)[0],
+                          old.get('status', ticket.status),
+                          old.get('priority', ticket.priority),
+                          old.get('assigned_to', ticket.assigned_to))
+    current = ticket_key(ticket)
+    if previous != current:
+        adjust(connection, previous, -1)
+        adjust(connection, current, 1)
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _ticket_deleted(mapper, connection, ticket):
+    adjust(connection, ticket_key(ticket), -1)
+
+
+def status_counts():
+    rows = db.session.query(TicketStat.status, func.sum(TicketStat.count)).group_by(TicketStat.status)
+    return {status: int(total or 0) for status, total in rows}
+
+
+def breakdown(group_by, since=None, until=None):
+    """Return ticket counts grouped by ``group_by`` (one or two of GROUP_COLUMNS)."""
+    columns = [GROUP_COLUMNS[name] for name in group_by]
+    query = db.session.query(*columns, func.sum(TicketStat.count)).group_by(*columns).order_by(*columns)
+    if since:
+        query = query.filter(TicketStat.day >= since)
+    if until:
+        query = query.filter(TicketStat.day <= until)
+    results = []
+    for row in query:
+        entry = {}
+        for name, value in zip(group_by, row[:-1]):
+            entry[name] = value.isoformat() if isinstance(value, date) else value
+        entry['count'] = int(row[-1] or 0)
+        if entry['count']:
+            results.append(entry)
+    return results
+
+
+def rebuild():
+    """Recompute every counter from the live and archived tickets."""
+    tickets = union_all(*(
+        select(model.created_at, model.status, model.priority, model.assigned_to)
+        for model in (Ticket, ArchivedTicket)
+    )).subquery()
+    day = func.date(tickets.c.created_at)
+    grouped = select(day, tickets.c.status, tickets.c.priority, tickets.c.assigned_to, func.count()) \
+        .group_by(day, tickets.c.status, tickets.c.priority, tickets.c.assigned_to)
+    db.session.execute(TicketStat.__table__.delete())
+    db.session.execute(insert(TicketStat).from_select(
+        ['day', 'status', 'priority', 'assigned_to', 'count'], grouped
+    ))
+    db.session.commit()
+    return db.session.query(func.count(TicketStat.id)).scalar()
+
+
+def parse_day(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+analytics_cli = AppGroup('analytics', help='Ticket analytics counters.')
+
+
+@analytics_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the ticket counters from scratch to repair drift."""
+    groups = rebuild()
+    click.echo(f"Rebuilt ticket counters: {groups} groups.")
@@ -11,9 +11,11 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 from config import Config
+from database import RoutingSession
+from pubsub import release, socketio_options
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = 'routes.login'
@@ -27,21 +29,65 @@ def create_app(config_class=Config):
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(os.path.dirname(app.config['LOG_FILE']), exist_ok=True)
 
+    import database
+    database.configure(app)
     db.init_app(app)
+    database.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
-    socketio.init_app(app)
+    if socketio.server is not None:
+        # Each app gets a new server (tests, benches); detach the previous one
+        release(socketio.server)
+    socketio.init_app(app, **socketio_options(app.config))
     limiter.init_app(app)
 
+    # Model event hooks
+    from permissions import permission_cache
+    permission_cache.maxsize = app.config['PERMISSION_CACHE_SIZE']
+    from identity import identity_cache
+    identity_cache.maxsize = app.config['IDENTITY_CACHE_SIZE']
+    identity_cache.ttl = app.config['IDENTITY_CACHE_TTL']
+    import instrumentation
+    instrumentation.init_app(app)
+    import passwords
+    passwords.init_app(app)
+    import audit
+    audit.init_app(app)
+    import fragments
+    fragments.init_app(app)
+
     # Register blueprints
     from routes import main as main_bp
     app.register_blueprint(main_bp)
     from admin_routes import admin as admin_bp
     app.register_blueprint(admin_bp, url_prefix='/admin')
 
+    # CLI commands
+    from flask_migrate.cli import db as db_cli
+    from index_advisor import index_report
+    db_cli.add_command(index_report)
+    from analytics import analytics_cli
+    app.cli.add_command(analytics_cli)
+    from storage import storage_cli
+    app.cli.add_command(storage_cli)
+    from search import search_cli
+    app.cli.add_command(search_cli)
+    from conversations import conversations_cli
+    app.cli.add_command(conversations_cli)
+    from audit import audit_cli
+    app.cli.add_command(audit_cli)
+    from changelog import changelog_cli
+    app.cli.add_command(changelog_cli)
+    from archive import tickets_cli
+    app.cli.add_command(tickets_cli)
+    from jobs import jobs_cli, worker_command
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(worker_command)
+
     # Logging configuration
     if not app.debug:
-        file_handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=10240, backupCount=10)
+        file_handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=app.config['LOG_MAX_BYTES'],
+                                           backupCount=app.config['LOG_BACKUP_COUNT'])
         file_handler.setFormatter(logging.Formatter(
             '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
         ))
@@ -0,0 +1,183 @@
+"""Hot/cold tiering: closed tickets moved out of the live tables.
+
+``flask tickets archive --closed-before YYYY-MM-DD`` moves tickets that
+were closed and last touched before that date, with their replies and the
+audit entries about them, into the ``archived_*`` tables. It works in
+batches of ``ARCHIVE_BATCH_SIZE`` tickets, one transaction per batch, with
+``INSERT ... SELECT``/``DELETE`` statements, so the live tables and their
+indexes only hold current work.
+
+Archived tickets keep their ids: ``ticket_detail`` falls back to the
+archive (read-only), their attachments stay referenced and the analytics
+counters keep counting them. They leave ticket lists (a ``remove`` change
+is logged for each) and search. ``flask tickets restore`` or the admin
+restore button move a ticket back.
+"""
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, func, insert, select
+
+from app import db
+from changelog import ACTION_INSERT, ACTION_REMOVE, record_many
+from models import ArchivedAuditLog, ArchivedTicket, ArchivedTicketReply, AuditLog, Ticket, TicketReply
+from search import index_tickets, unindex_tickets
+
+ARCHIVED_STATUS = 'closed'
+# (live, archive) pairs, parents first; rows move with their ids
+TABLES = (
+    (Ticket, ArchivedTicket),
+    (TicketReply, ArchivedTicketReply),
+    (AuditLog, ArchivedAuditLog),
+)
+
+
+class ArchiveConflict(ValueError):
+    pass
+
+
+def _rows_of(model, ticket_ids):
+    if model in (Ticket, ArchivedTicket):
+        return model.id.in_(ticket_ids)
+    if model in (TicketReply, ArchivedTicketReply):
+        return model.ticket_id.in_(ticket_ids)
+    return and_(model.target_type == 'ticket', model.target_id.in_(ticket_ids))
+
+
+def _check_free(connection, pairs, ticket_ids):
+    """Raise ArchiveConflict if any row about to move already exists at its destination."""
+    for source, target in pairs:
+        taken = connection.scalars(select(target.id).where(
+            target.id.in_(select(source.id).where(_rows_of(source, ticket_ids)))).limit(10)).all()
+        if taken:
+            raise ArchiveConflict(f"{target.__tablename__} already has rows with ids "
+                                  f"{', '.join(map(str, taken))}; resolve them before moving tickets "
+                                  f"{', '.join(map(str, ticket_ids))}.")
+
+
+def _transfer(connection, pairs, ticket_ids):
+    _check_free(connection, pairs, ticket_ids)
+    for source, target in pairs:
+        names = [column.name for column in target.__table__.columns if column.name in source.__table__.columns]
+        connection.execute(insert(target).from_select(
+            names, select(*(source.__table__.c[name] for name in names)).where(_rows_of(source, ticket_ids))))
+    for source, _ in reversed(pairs):
+        connection.execute(delete(source).where(_rows_of(source, ticket_ids)))
+
+
+def closed_before(cutoff):
+    """Ids of tickets closed and last changed before ``cutoff``."""
+    last_changed = func.coalesce(Ticket.updated_at, Ticket.created_at)
+    return select(Ticket.id).where(Ticket.status == ARCHIVED_STATUS, last_changed < cutoff).order_by(Ticket.id)
+
+
+def _archive_batch(connection, ticket_ids):
+    """Archive the tickets in ``ticket_ids`` that are still closed; return ``[(id, owner_id)]``."""
+    rows = connection.execute(
+        select(Ticket.id, Ticket.user_id)
+        .where(Ticket.id.in_(ticket_ids), Ticket.status == ARCHIVED_STATUS).with_for_update()
+    ).all()
+    if not rows:
+        return []
+    ticket_ids = [row.id for row in rows]
+    unindex_tickets(connection, ticket_ids)
+    _transfer(connection, TABLES, ticket_ids)
+    return [tuple(row) for row in rows]
+
+
+def archive(cutoff, batch_size=None, progress=None):
+    """Archive every ticket closed before ``cutoff``; return how many moved.
+
+    ``progress(archived)`` is called after each committed batch. A batch
+    whose ids already exist in the archive raises ArchiveConflict; earlier
+    batches stay committed.
+    """
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    archived = last_id = 0
+    while True:
+        ticket_ids = db.session.scalars(closed_before(cutoff).where(Ticket.id > last_id).limit(batch_size)).all()
+        if not ticket_ids:
+            return archived
+        last_id = ticket_ids[-1]
+        connection = db.session.connection()
+        try:
+            moved = _archive_batch(connection, ticket_ids)
+            record_many(db.session, moved, ACTION_REMOVE)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        archived += len(moved)
+        if progress:
+            progress(archived)
+
+
+def restore(ticket_ids):
+    """Move archived tickets back to the live tables; return the ids restored.
+
+    Raises ArchiveConflict, leaving everything in place, if a live row
+    already uses one of the ids.
+    """
+    connection = db.session.connection()
+    try:
+        rows = [tuple(row) for row in connection.execute(
+            select(ArchivedTicket.id, ArchivedTicket.user_id)
+            .where(ArchivedTicket.id.in_(ticket_ids)).with_for_update()
+        )]
+        if rows:
+            restored = [ticket_id for ticket_id, _ in rows]
+            _transfer(connection, [(target, source) for source, target in TABLES], restored)
+            index_tickets(connection, restored)
+            record_many(db.session, rows, ACTION_INSERT)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return [ticket_id for ticket_id, _ in rows]
+
+
+def find_ticket(ticket_id):
+    """The live ticket with ``ticket_id``, else its archived copy, else None."""
+    return db.session.get(Ticket, ticket_id) or db.session.get(ArchivedTicket, ticket_id)
+
+
+tickets_cli = AppGroup('tickets', help='Ticket archive.')
+
+
+@tickets_cli.command('archive')
+@click.option('--closed-before', 'closed_before_date', required=True,
+              help='Archive tickets closed and unchanged since before this date (YYYY-MM-DD).')
+@click.option('--batch-size', type=int, default=None, help='Tickets per transaction (default ARCHIVE_BATCH_SIZE).')
+@click.option('--dry-run', is_flag=True, help='Only count the tickets that would be archived.')
+def archive_command(closed_before_date, batch_size, dry_run):
+    """Move old closed tickets, their replies and audit entries to the archive tables."""
+    try:
+        cutoff = datetime.strptime(closed_before_date, '%Y-%m-%d')
+    except ValueError:
+        raise click.BadParameter('Use YYYY-MM-DD.', param_hint='--closed-before')
+    if dry_run:
+        count = db.session.scalar(select(func.count()).select_from(closed_before(cutoff).subquery()))
+        click.echo(f"{count} tickets would be archived.")
+        return
+    try:
+        archived = archive(cutoff, batch_size,
+                           progress=lambda done: click.echo(f"Archived {done} tickets...", err=True))
+    except ArchiveConflict as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f"Archived {archived} tickets.")
+
+
+@tickets_cli.command('restore')
+@click.argument('ticket_ids', nargs=-1, type=int, required=True)
+def restore_command(ticket_ids):
+    """Move archived tickets back to the live tables."""
+    try:
+        restored = restore(list(ticket_ids))
+    except ArchiveConflict as exc:
+        raise click.ClickException(str(exc))
+    missing = sorted(set(ticket_ids) - set(restored))
+    click.echo(f"Restored {len(restored)} tickets.")
+    if missing:
+        click.echo(f"Not archived: {', '.join(map(str, missing))}", err=True)
@@ -0,0 +1,115 @@
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+from sqlalchemy import or_
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import send_file
+
+from app import db
+from models import ArchivedTicket, ArchivedTicketReply, Ticket, TicketReply, Message
+from storage import digest_of, relative_path, resolve_path
+
+SENDFILE_MODES = (None, 'x-accel', 'x-sendfile')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class _DigestCache:
+    """Content digests keyed on (path, size, mtime) so unchanged files are hashed once."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def digest(self, path, stat):
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        value = sha.hexdigest()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+
+_digests = _DigestCache()
+
+
+def can_access_attachment(user, filename):
+    """True if ``user`` may see the ticket reply or private message owning ``filename``."""
+    for reply_model, ticket_model in ((TicketReply, Ticket), (ArchivedTicketReply, ArchivedTicket)):
+        replies = db.session.query(reply_model.id).filter(reply_model.attachment == filename)
+        if not user.is_admin():
+            replies = replies.join(ticket_model, ticket_model.id == reply_model.ticket_id) \
+                .filter(ticket_model.user_id == user.id)
+        if db.session.query(replies.exists()).scalar():
+            return True
+    messages = db.session.query(Message.id).filter(
+        Message.attachment == filename,
+        or_(Message.sender_id == user.id, Message.recipient_id == user.id),
+    )
+    return db.session.query(messages.exists()).scalar()
+
+
+def attachment_path(filename):
+    path = resolve_path(filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    return path
+
+
+def download_name(filename):
+    """Strip the unique prefix ``save_file`` adds to the uploaded name."""
+    return filename.split('_', 1)[-1]
+
+
+def attachment_etag(filename, path, stat):
+    return digest_of(filename) or _digests.digest(path, stat)
+
+
+def send_attachment(filename):
+    """Serve an upload with strong ETags, conditional GET and byte ranges.
+
+    With ``ATTACHMENT_SENDFILE`` set to ``'x-accel'`` or ``'x-sendfile'``
+    only headers are produced and the front proxy streams the bytes (and
+    answers Range requests itself).
+    """
+    path = attachment_path(filename)
+    stat = os.stat(path)
+    mode = current_app.config['ATTACHMENT_SENDFILE']
+    environ = request.environ
+    if mode:
+        environ = {key: value for key, value in environ.items() if key != 'HTTP_RANGE'}
+
+    response = send_file(
+        path,
+        environ,
+        mimetype=mimetypes.guess_type(download_name(filename))[0] or 'application/octet-stream',
+        download_name=download_name(filename),
+        conditional=True,
+        etag=attachment_etag(filename, path, stat),
+        last_modified=stat.st_mtime,
+        use_x_sendfile=bool(mode),
+        response_class=current_app.response_class,
+        _root_path=current_app.root_path,
+    )
+    if mode == 'x-accel' and 'X-Sendfile' in response.headers:
+        del response.headers['X-Sendfile']
+        response.headers['X-Accel-Redirect'] = current_app.config['ATTACHMENT_ACCEL_PREFIX'] + relative_path(filename)
+    elif not mode:
+        response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['ATTACHMENT_MAX_AGE']
+    return response
@@ -0,0 +1,300 @@
+"""Audit trail: queued, batched writes plus the viewer and archive tooling.
+
+``audit()`` only appends to an in-process queue. A background task writes
+the queue in one multi-row INSERT whenever ``AUDIT_BATCH_SIZE`` entries are
+waiting or ``AUDIT_FLUSH_INTERVAL`` seconds have passed, and once more at
+interpreter exit. With ``AUDIT_ASYNC`` off every call is written straight
+away (tests, CLI).
+
+Old entries are moved to gzip-compressed JSONL files, one per month and
+batch, with ``flask audit archive --before YYYY-MM-DD``.
+"""
+import atexit
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_request_context, request
+from flask.cli import AppGroup
+from flask_login import current_user
+from sqlalchemy import delete, insert, inspect
+
+from app import db, socketio
+from listing import keyset_page, parse_limit
+from models import AuditLog, User
+
+ARCHIVE_CHUNK_SIZE = 1000
+ARCHIVE_NAME = re.compile(r'^audit-(?P<month>\d{4}-\d{2})\.(?P<low>\d+)-(?P<high>\d+)\.jsonl\.gz$')
+# How often the background writer checks the queue, in seconds
+FLUSH_TICK = 0.1
+# Actions recorded by the app, offered as filters in the viewer
+ACTIONS = ('login', 'login.failed', 'ticket.update', 'ticket.bulk_update', 'ticket.restore', 'user.delete',
+           'permissions.update')
+
+
+class AuditQueue:
+    def __init__(self):
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self._worker_started = False
+        self.app = None
+        self.written = 0
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, entry):
+        config = self.app.config
+        self._entries.append(entry)
+        if not config['AUDIT_ASYNC'] or len(self._entries) >= config['AUDIT_QUEUE_MAX']:
+            # Synchronous mode, or the writer is falling behind: apply backpressure.
+            self.flush()
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker_started:
+            return
+        with self._lock:
+            if not self._worker_started:
+                self._worker_started = True
+                socketio.start_background_task(self._run)
+
+    def _run(self):
+        # socketio.sleep yields properly under eventlet/gevent as well as threads.
+        last_flush = time.monotonic()
+        while True:
+            socketio.sleep(FLUSH_TICK)
+            due = time.monotonic() - last_flush >= self.app.config['AUDIT_FLUSH_INTERVAL']
+            if not due and len(self._entries) < self.app.config['AUDIT_BATCH_SIZE']:
+                continue
+            last_flush = time.monotonic()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Audit log flush failed')
+
+    def flush(self):
+        """Write everything queued so far; return the number of rows written."""
+        if self.app is None:
+            return 0
+        with self._lock:
+            batch = []
+            while self._entries:
+                batch.append(self._entries.popleft())
+            if not batch:
+                return 0
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(insert(AuditLog), batch)
+            except Exception:
+                # Keep the entries for the next attempt, in their original order.
+                self._entries.extendleft(reversed(batch))
+                raise
+            self.written += len(batch)
+            return len(batch)
+
+
+audit_queue = AuditQueue()
+
+
+def audit(action, user_id=None, target=None, details=None):
+    """Record ``action`` by ``user_id`` (defaults to the current user).
+
+    ``target`` is a model instance or a ``(type, id)`` pair; ``details`` is
+    free text or anything JSON serialisable.
+    """
+    target_type = target_id = None
+    if isinstance(target, tuple):
+        target_type, target_id = target
+    elif target is not None:
+        target_type, target_id = type(target).__name__.lower(), target.id
+    ip_address = None
+    if has_request_context():
+        ip_address = request.remote_addr
+        if user_id is None and current_user.is_authenticated:
+            user_id = current_user.id
+    if details is not None and not isinstance(details, str):
+        details = json.dumps(details, sort_keys=True, default=str)
+    audit_queue.put({
+        'user_id': user_id,
+        'action': action,
+        'timestamp': datetime.utcnow(),
+        'target_type': target_type,
+        'target_id': target_id,
+        'details': details,
+        'ip_address': ip_address,
+    })
+
+
+def changed_fields(target, fields):
+    """``{field: [old, new]}`` for pending attribute changes; call before commit."""
+    state = inspect(target)
+    changes = {}
+    for field in fields:
+        history = state.attrs[field].history
+        if history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            if old != new:
+                changes[field] = [old, new]
+    return changes
+
+
+def init_app(app):
+    audit_queue.init_app(app)
+
+
+# Viewer
+
+def parse_day(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def parse_filters(args):
+    """Pick user/action/since/until filters out of request args; raise ValueError on bad input."""
+    filters = {}
+    user = (args.get('user') or '').strip()
+    if user:
+        filters['user'] = user
+    action = (args.get('action') or '').strip()
+    if action:
+        filters['action'] = action
+    for name in ('since', 'until'):
+        value = (args.get(name) or '').strip()
+        if value:
+            parse_day(value)
+            filters[name] = value
+    return filters
+
+
+def filtered_query(filters):
+    query = AuditLog.query.options(db.joinedload(AuditLog.user))
+    if 'user' in filters:
+        value = filters['user']
+        if value.isdigit():
+            query = query.filter(AuditLog.user_id == int(value))
+        else:
+            query = query.join(User, User.id == AuditLog.user_id).filter(User.username == value)
+    if 'action' in filters:
+        query = query.filter(AuditLog.action == filters['action'])
+    if 'since' in filters:
+        query = query.filter(AuditLog.timestamp >= parse_day(filters['since']))
+    if 'until' in filters:
+        # Inclusive of the whole ``until`` day
+        query = query.filter(AuditLog.timestamp < parse_day(filters['until']) + timedelta(days=1))
+    return query
+
+
+def list_audit_logs(args):
+    """One keyset page of audit entries, newest first, plus the filters applied."""
+    filters = parse_filters(args)
+    limit = parse_limit(args, 'AUDIT_LOGS_PER_PAGE', 'AUDIT_LOGS_MAX_PER_PAGE')
+    logs, next_cursor = keyset_page(filtered_query(filters), AuditLog.timestamp, AuditLog.id,
+                                    args.get('cursor') or None, limit)
+    return logs, next_cursor, filters
+
+
+# Archiving
+
+def _archived_ids(directory, month, low, high):
+    """Ids already in ``month``'s batch files whose id range overlaps ``low``..``high``."""
+    ids = set()
+    for name in os.listdir(directory):
+        match = ARCHIVE_NAME.match(name)
+        if match and match['month'] == month and int(match['low']) <= high and int(match['high']) >= low:
+            with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as fh:
+                ids.update(json.loads(line)['id'] for line in fh)
+    return ids
+
+
+def _write_batch(path, entries):
+    """Write ``entries`` to a temp file, fsync it and rename it to ``path``."""
+    temp = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp, 'wb') as raw:
+        with gzip.open(raw, 'wt', encoding='utf-8') as fh:
+            for entry in entries:
+                fh.write(json.dumps({
+                    'id': entry.id,
+                    'timestamp': entry.timestamp.isoformat(),
+                    'user_id': entry.user_id,
+                    'action': entry.action,
+                    'target_type': entry.target_type,
+                    'target_id': entry.target_id,
+                    'details': entry.details,
+                    'ip_address': entry.ip_address,
+                }, sort_keys=True) + '\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temp, path)
+    directory = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def archive(before, directory):
+    """Move entries older than ``before`` to gzip JSONL files, one per month and batch.
+
+    Returns ``{month: rows}``. A batch's rows are deleted only after its
+    file has been fsynced and renamed into place. If the delete never
+    commits, the next run finds those ids in the file and does not write
+    them again.
+    """
+    os.makedirs(directory, exist_ok=True)
+    archived = {}
+    while True:
+        rows = AuditLog.query.filter(AuditLog.timestamp < before) \
+            .order_by(AuditLog.timestamp, AuditLog.id).limit(ARCHIVE_CHUNK_SIZE).all()
+        if not rows:
+            break
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row.timestamp.strftime('%Y-%m'), []).append(row)
+        for month, entries in by_month.items():
+            ids = [entry.id for entry in entries]
+            done = _archived_ids(directory, month, min(ids), max(ids))
+            pending = [entry for entry in entries if entry.id not in done]
+            if pending:
+                # Named after its own id range: a file already holding both ends would have made them done
+                low, high = min(entry.id for entry in pending), max(entry.id for entry in pending)
+                _write_batch(os.path.join(directory, f'audit-{month}.{low}-{high}.jsonl.gz'), pending)
+            archived[month] = archived.get(month, 0) + len(entries)
+        db.session.execute(delete(AuditLog).where(AuditLog.id.in_([row.id for row in rows])))
+        db.session.commit()
+        db.session.expunge_all()
+    return archived
+
+
+audit_cli = AppGroup('audit', help='Audit log maintenance.')
+
+
+@audit_cli.command('archive')
+@click.option('--before', required=True, help='Archive entries older than this date (YYYY-MM-DD).')
+@click.option('--dir', 'directory', default=None, help='Archive directory (default AUDIT_ARCHIVE_DIR).')
+def archive_command(before, directory):
+    """Move old audit entries to compressed monthly JSONL files."""
+    try:
+        cutoff = parse_day(before)
+    except ValueError:
+        raise click.BadParameter('Use YYYY-MM-DD.', param_hint='--before')
+    directory = directory or current_app.config['AUDIT_ARCHIVE_DIR']
+    archived = archive(cutoff, directory)
+    for month, count in sorted(archived.items()):
+        click.echo(f"{month}: {count} entries")
+    click.echo(f"Archived {sum(archived.values())} entries to {directory}.")
@@ -0,0 +1,163 @@
+"""Attachment download throughput under concurrent clients.
+
+Runs the app under eventlet in a child process with a seeded ticket
+attachment, then downloads it from many client threads and reports
+aggregate throughput and per-download latency.
+
+    python bench/attachment_throughput.py --size-mb 20 --concurrency 16 --downloads 64
+    python bench/attachment_throughput.py --range-kb 512     # ranged (resumable) reads
+    python bench/attachment_throughput.py --sendfile x-accel # offload headers only
+"""
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ATTACHMENT = 'benchmark_attachment.zip'
+
+
+def _serve(port, workdir, size_mb, sendfile):
+    import eventlet
+    eventlet.monkey_patch()
+    sys.path.insert(0, ROOT)
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        LOG_FILE = os.path.join(workdir, 'logs', 'app.log')
+        WTF_CSRF_ENABLED = False
+        RATELIMIT_ENABLED = False
+        ATTACHMENT_SENDFILE = sendfile
+
+    from app import create_app, db, socketio
+    from models import User, Ticket, TicketReply, ROLE_ADMIN
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', role=ROLE_ADMIN)
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.flush()
+        ticket = Ticket(subject='bench', description='bench', user_id=user.id)
+        db.session.add(ticket)
+        db.session.flush()
+        db.session.add(TicketReply(message='bench', ticket_id=ticket.id, user_id=user.id, attachment=ATTACHMENT))
+        db.session.commit()
+        with open(os.path.join(BenchConfig.UPLOAD_FOLDER, ATTACHMENT), 'wb') as fh:
+            block = os.urandom(1024 * 1024)
+            for _ in range(size_mb):
+                fh.write(block)
+    socketio.run(app, host='127.0.0.1', port=port, log_output=False)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit('server did not start')
+
+
+def _login(base):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    body = urllib.parse.urlencode({'username': 'bench', 'password': 'bench'}).encode()
+    opener.open(base + '/login', body).read()
+    return jar
+
+
+def _download(base, jar, range_kb, size):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    request = urllib.request.Request(f'{base}/uploads/{ATTACHMENT}')
+    received = 0
+    started = time.perf_counter()
+    if range_kb:
+        step = range_kb * 1024
+        for offset in range(0, size, step):
+            request.headers['Range'] = f'bytes={offset}-{min(offset + step, size) - 1}'
+            with opener.open(request) as response:
+                received += len(response.read())
+    else:
+        with opener.open(request) as response:
+            while True:
+                chunk = response.read(256 * 1024)
+                if not chunk:
+                    break
+                received += len(chunk)
+    return time.perf_counter() - started, received
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(size_mb, concurrency, downloads, range_kb, sendfile):
+    port = _free_port()
+    base = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as workdir:
+        server = multiprocessing.get_context('spawn').Process(
+            target=_serve, args=(port, workdir, size_mb, sendfile), daemon=True)
+        server.start()
+        try:
+            _wait_for(port)
+            jar = _login(base)
+            size = size_mb * 1024 * 1024
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                results = list(pool.map(lambda _: _download(base, jar, range_kb, size), range(downloads)))
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.join()
+
+    latencies = [seconds for seconds, _ in results]
+    received = sum(count for _, count in results)
+    return {
+        'size_mb': size_mb,
+        'concurrency': concurrency,
+        'downloads': downloads,
+        'range_kb': range_kb,
+        'sendfile': sendfile,
+        'bytes_received': received,
+        'throughput_mb_s': round(received / elapsed / (1024 * 1024), 2),
+        'latency_s': {name: round(percentile(latencies, pct), 4)
+                      for name, pct in (('p50', 50), ('p95', 95), ('p99', 99))},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--downloads', type=int, default=32)
+    parser.add_argument('--range-kb', type=int, default=0, help='fetch in ranged chunks of this size')
+    parser.add_argument('--sendfile', choices=('x-accel', 'x-sendfile'), default=None)
+    args = parser.parse_args()
+    print(json.dumps(run(args.size_mb, args.concurrency, args.downloads, args.range_kb, args.sendfile), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Seeded synthetic data for benchmarks.
+
+Bulk-loads users, tickets, replies, private messages and audit logs with
+Core ``executemany`` inserts in chunks, then rebuilds the derived tables
+(analytics counters, search index, conversation summaries) in set-based
+passes, since Core inserts bypass the ORM hooks that normally keep them
+current. The same seed always produces the same rows; timestamps are
+spread over the ``--days`` before now.
+
+    python bench/datagen.py --db sqlite:////tmp/bench.db --users 1000 --tickets 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHUNK_SIZE = 5000
+PASSWORD = 'bench'
+WORDS = ('printer network email login password reset laptop screen vpn access account error '
+         'slow crash update install license invoice refund shipping order delivery broken '
+         'urgent request question report dashboard mobile sync backup restore timeout').split()
+
+SCALES = {
+    'small': dict(users=200, agents=10, tickets=2000, replies=3, messages=2000, audit_logs=2000),
+    'medium': dict(users=2000, agents=50, tickets=50000, replies=4, messages=50000, audit_logs=50000),
+    'large': dict(users=100000, agents=500, tickets=1000000, replies=5, messages=500000, audit_logs=1000000),
+}
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bulk_insert(connection, table, rows):
+    count = 0
+    for chunk in _chunks(rows):
+        connection.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def generate(users=200, agents=10, tickets=2000, replies=3, messages=2000, audit_logs=2000,
+             days=180, seed=1):
+    """Populate the current app's database; returns row counts per table.
+
+    User 1 is an admin named ``bench_admin``, users 2..agents+1 are support
+    agents (``agent<N>``) and the rest are customers (``user<N>``); all share
+    the password ``bench``. Expects empty tables.
+    """
+    from werkzeug.security import generate_password_hash
+
+    import analytics
+    import conversations
+    import search
+    from app import db
+    from audit import ACTIONS
+    from models import (User, Ticket, TicketReply, Message, AuditLog, ROLE_ADMIN, ROLE_SUPPORT, ROLE_USER,
+                        TICKET_STATUSES, TICKET_PRIORITIES)
+
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    span = int((now - start).total_seconds())
+    password_hash = generate_password_hash(PASSWORD)
+    agent_ids = list(range(2, agents + 2))
+    customer_ids = list(range(agents + 2, users + 1)) or [1]
+
+    def moment(after=None):
+        base = after or start
+        return base + timedelta(seconds=rng.randrange(max(1, int((now - base).total_seconds()))))
+
+    def user_rows():
+        for user_id in range(1, users + 1):
+            if user_id == 1:
+                name, role = 'bench_admin', ROLE_ADMIN
+            elif user_id in agent_ids:
+                name, role = f'agent{user_id}', ROLE_SUPPORT
+            else:
+                name, role = f'user{user_id}', ROLE_USER
+            yield {'id': user_id, 'username': name, 'email': f'{name}@bench.example', 'role': role,
+                   'password_hash': password_hash, 'full_name': name.title(), 'perm_version': 0,
+                   'can_create_ticket': True, 'can_view_ticket': True, 'can_reply_ticket': True,
+                   'can_edit_ticket': role != ROLE_USER, 'can_delete_ticket': role == ROLE_ADMIN,
+                   'created_at': start}
+
+    ticket_meta = {}
+
+    def ticket_rows():
+        for ticket_id in range(1, tickets + 1):
+            created_at = start + timedelta(seconds=rng.randrange(span))
+            owner_id = rng.choice(customer_ids)
+            ticket_meta[ticket_id] = (created_at, owner_id)
+            yield {'id': ticket_id, 'subject': _text(rng, 5).capitalize(), 'description': _text(rng, 40),
+                   'status': rng.choice(TICKET_STATUSES), 'priority': rng.choice(TICKET_PRIORITIES),
+                   'created_at': created_at, 'user_id': owner_id,
+                   'assigned_to': rng.choice(agent_ids) if agent_ids and rng.random() < 0.7 else None}
+
+    def reply_rows():
+        for ticket_id in range(1, tickets + 1):
+            created_at, owner_id = ticket_meta[ticket_id]
+            for _ in range(rng.randint(0, replies * 2)):
+                author = rng.choice(agent_ids) if agent_ids and rng.random() < 0.5 else owner_id
+                yield {'message': _text(rng, 25), 'ticket_id': ticket_id, 'user_id': author,
+                       'created_at': moment(created_at)}
+
+    def message_rows():
+        for _ in range(messages):
+            sender, recipient = rng.sample(range(1, users + 1), 2) if users > 1 else (1, 1)
+            yield {'body': _text(rng, 15), 'sender_id': sender, 'recipient_id': recipient,
+                   'timestamp': moment()}
+
+    def audit_rows():
+        for _ in range(audit_logs):
+            yield {'user_id': rng.randint(1, users), 'action': rng.choice(ACTIONS), 'timestamp': moment(),
+                   'ip_address': f'10.0.{rng.randrange(256)}.{rng.randrange(256)}'}
+
+    counts = {}
+    timings = {}
+    with db.engine.begin() as connection:
+        for name, model, rows in (('user', User, user_rows()), ('ticket', Ticket, ticket_rows()),
+                                  ('ticket_reply', TicketReply, reply_rows()),
+                                  ('message', Message, message_rows()),
+                                  ('audit_log', AuditLog, audit_rows())):
+            started = time.perf_counter()
+            counts[name] = _bulk_insert(connection, model.__table__, rows)
+            timings[name] = round(time.perf_counter() - started, 3)
+
+    for name, rebuild in (('ticket_stat', analytics.rebuild), ('search_document', search.reindex),
+                          ('conversation', conversations.rebuild)):
+        started = time.perf_counter()
+        counts[name] = rebuild()
+        timings[name] = round(time.perf_counter() - started, 3)
+    return {'rows': counts, 'seconds': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='SQLAlchemy URL of the database to fill')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for name in ('users', 'agents', 'tickets', 'replies', 'messages', 'audit_logs'):
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=None,
+                            help=f'override the scale preset ({name})')
+    parser.add_argument('--days', type=int, default=180, help='spread timestamps over this many days')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.db
+        LOG_FILE = os.devnull
+
+    from app import create_app, db
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        print(json.dumps(generate(days=args.days, seed=args.seed, **sizes), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Latency, SQL-count and memory benchmarks for the main views.
+
+Builds a throwaway SQLite database with ``datagen``, then drives scripted
+scenarios against ``create_app()`` through the Flask test client and the
+Flask-SocketIO test client. Each scenario reports p50/p95/p99 latency, the
+median number of SQL statements per request and (with ``--memory``) the
+peak Python allocation. Results are JSON so runs can be saved as baselines
+and compared later.
+
+    python bench/scenarios.py --scale small --save bench/baselines/small.json
+    python bench/scenarios.py --scale small --compare bench/baselines/small.json
+    python bench/scenarios.py --only dashboard_admin,ticket_detail --iterations 200
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datagen import PASSWORD, SCALES, WORDS, generate  # noqa: E402
+
+SOCKET_CLIENTS = 20
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _make_app(workdir):
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        LOG_FILE = os.path.join(workdir, 'logs', 'app.log')
+        WTF_CSRF_ENABLED = False
+        RATELIMIT_ENABLED = False
+        AUDIT_ASYNC = False
+        # Run side-effect jobs in the request so emits are measured and nothing piles up
+        JOBS_MODE = 'inline'
+        SQL_QUERY_COUNT_HEADER = True
+
+    from app import create_app
+    return create_app(BenchConfig)
+
+
+def _login(app, username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f'login failed for {username}')
+    return client
+
+
+class Scenario:
+    """A named request generator; ``step(i)`` performs one request and returns the response."""
+
+    def __init__(self, name, step, setup=None):
+        self.name = name
+        self.step = step
+        self.setup = setup
+
+
+def build_scenarios(app, sizes, rng):
+    admin = _login(app, 'bench_admin')
+    customer_id = sizes['agents'] + 2
+    customer = _login(app, f'user{customer_id}')
+    tickets = sizes['tickets']
+    state = {}
+
+    def random_ticket(_):
+        return admin.get(f'/ticket/{rng.randint(1, tickets)}')
+
+    def deep_page(i):
+        # Walk the cursor chain; restart from the top every 20 pages.
+        cursor = state.get('cursor') if i % 20 else None
+        response = admin.get('/api/tickets', query_string={'cursor': cursor} if cursor else {})
+        state['cursor'] = response.get_json()['next_cursor']
+        return response
+
+    def partial_cached(_):
+        if 'etag' not in state:
+            state['etag'] = admin.get('/tickets_partial').headers['ETag']
+        return admin.get('/tickets_partial', headers={'If-None-Match': state['etag']})
+
+    def edit_ticket(_):
+        return admin.post(f'/admin/ticket/{rng.randint(1, tickets)}/edit', data={
+            'status': rng.choice(('open', 'in progress', 'closed')),
+            'priority': rng.choice(('low', 'normal', 'high')),
+        })
+
+    def socketio_fanout_setup():
+        from app import socketio
+        state['sockets'] = [socketio.test_client(app, flask_test_client=_login(app, 'bench_admin'))
+                            for _ in range(SOCKET_CLIENTS)]
+
+    def socketio_fanout(i):
+        response = edit_ticket(i)
+        delivered = 0
+        for socket in state['sockets']:
+            delivered += sum(1 for packet in socket.get_received() if packet['name'] == 'ticket_diff')
+        state['delivered'] = state.get('delivered', 0) + delivered
+        return response
+
+    return [
+        Scenario('login', lambda _: app.test_client().post(
+            '/login', data={'username': 'bench_admin', 'password': PASSWORD})),
+        Scenario('dashboard_admin', lambda _: admin.get('/admin/dashboard')),
+        Scenario('dashboard_customer', lambda _: customer.get('/dashboard')),
+        Scenario('dashboard_filtered', lambda _: admin.get('/admin/dashboard', query_string={
+            'status': rng.choice(('open', 'closed')), 'priority': 'high'})),
+        Scenario('ticket_list_deep_pages', deep_page),
+        Scenario('tickets_partial_304', partial_cached),
+        Scenario('ticket_detail', random_ticket),
+        Scenario('analytics_pie', lambda _: admin.get('/admin/analytics_data')),
+        Scenario('analytics_breakdown', lambda _: admin.get('/admin/analytics_data', query_string={
+            'group_by': 'status,day'})),
+        Scenario('search', lambda _: admin.get('/api/search', query_string={'q': rng.choice(WORDS)})),
+        Scenario('conversations', lambda _: customer.get('/messages/conversations')),
+        Scenario('audit_logs', lambda _: admin.get('/admin/audit_logs')),
+        Scenario('ticket_edit', edit_ticket),
+        Scenario('socketio_fanout', socketio_fanout, setup=socketio_fanout_setup),
+    ], state
+
+
+def run_scenario(scenario, iterations, warmup, trace_memory):
+    if scenario.setup:
+        scenario.setup()
+    for i in range(warmup):
+        scenario.step(i)
+    latencies, queries, statuses = [], [], {}
+    if trace_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(iterations):
+        started = time.perf_counter()
+        response = scenario.step(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(int(response.headers.get('X-SQL-Queries', 0)))
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    result = {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'queries': statistics.median(queries),
+        'max_queries': max(queries),
+        'status': statuses,
+    }
+    if trace_memory:
+        result['mem_peak_kb'] = round((tracemalloc.get_traced_memory()[1] - baseline) / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def run(scale, iterations, warmup, seed, only=None, trace_memory=False, sizes=None):
+    sizes = dict(sizes or SCALES[scale])
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        app = _make_app(workdir)
+        from app import db
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            generated = generate(seed=seed, **sizes)
+            generate_seconds = round(time.perf_counter() - started, 2)
+        scenarios, state = build_scenarios(app, sizes, rng)
+        results = {}
+        for scenario in scenarios:
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = run_scenario(scenario, iterations, warmup, trace_memory)
+            if scenario.name == 'socketio_fanout':
+                results[scenario.name]['clients'] = SOCKET_CLIENTS
+                results[scenario.name]['diffs_delivered'] = state.get('delivered', 0)
+    return {
+        'meta': {
+            'scale': scale,
+            'sizes': sizes,
+            'seed': seed,
+            'iterations': iterations,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'generate_seconds': generate_seconds,
+            'rows': generated['rows'],
+        },
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'scenarios': results,
+    }
+
+
+def compare(current, baseline, tolerance, min_delta_ms=1.0):
+    """Return (report lines, regressions) comparing p95 latency and SQL counts."""
+    lines, regressions = [], []
+    header = f"{'scenario':26} {'p95 base':>10} {'p95 now':>10} {'change':>8} {'sql base':>9} {'sql now':>8}"
+    lines.append(header)
+    for name, now in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            lines.append(f"{name:26} {'-':>10} {now['p95_ms']:>10.2f} {'new':>8}")
+            continue
+        change = (now['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        flag = ''
+        if change > tolerance and now['p95_ms'] - base['p95_ms'] > min_delta_ms:
+            flag = '  SLOWER'
+            regressions.append(name)
+        if now['queries'] > base['queries']:
+            flag += '  MORE SQL'
+            if name not in regressions:
+                regressions.append(name)
+        lines.append(f"{name:26} {base['p95_ms']:>10.2f} {now['p95_ms']:>10.2f} {change:>+8.0%} "
+                     f"{base['queries']:>9} {now['queries']:>8}{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', default='', help='comma-separated scenario names')
+    parser.add_argument('--memory', action='store_true', help='trace peak Python allocations per scenario')
+    parser.add_argument('--save', help='write the results JSON here (e.g. a new baseline)')
+    parser.add_argument('--compare', help='baseline JSON to compare against; exits 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    only = {name for name in re.split(r'[,\s]+', args.only) if name}
+    results = run(args.scale, args.iterations, args.warmup, args.seed, only, args.memory)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as fh:
+            fh.write(output + '\n')
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print('\n'.join(lines), file=sys.stderr)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Emit-to-receive latency of the Socket.IO pub/sub backend across worker processes.
+
+Starts N listener processes, each running the client manager's listening
+loop exactly as a Socket.IO worker would, then publishes timestamped emits
+from the parent and reports the latency every listener observed.
+
+    python bench/socketio_fanout.py --queue sqlite:////tmp/socketio-bench.db --workers 4
+    python bench/socketio_fanout.py --queue redis://localhost:6379/0 --workers 8 --messages 2000
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pubsub import MemoryManager, client_manager_class  # noqa: E402
+
+CHANNEL = 'socketio-bench'
+
+
+class _Server:
+    """The parts of ``socketio.Server`` the listening loop touches."""
+    logger = logging.getLogger('socketio-bench')
+
+    @staticmethod
+    def sleep(seconds=0):
+        time.sleep(seconds)
+
+
+def _listener(url, expected, ready, results, timeout):
+    latencies = []
+    done = threading.Event()
+
+    class Probe(client_manager_class(url)):
+        def _handle_emit(self, message):
+            latencies.append(time.time() - message['data'][0]['sent_at'])
+            if len(latencies) >= expected:
+                done.set()
+
+    manager = Probe(url, channel=CHANNEL)
+    manager.server = _Server()
+    threading.Thread(target=manager._thread, daemon=True).start()
+    time.sleep(0.2)
+    ready.set()
+    done.wait(timeout)
+    results.put(latencies)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(url, workers, messages, rate, timeout):
+    if client_manager_class(url) is MemoryManager:
+        raise SystemExit('memory:// cannot cross process boundaries; use sqlite:/// or redis://')
+    results = multiprocessing.Queue()
+    events = [multiprocessing.Event() for _ in range(workers)]
+    processes = [multiprocessing.Process(target=_listener, args=(url, messages, ready, results, timeout))
+                 for ready in events]
+    for process in processes:
+        process.start()
+    for ready in events:
+        ready.wait(timeout)
+
+    publisher = client_manager_class(url)(url, channel=CHANNEL, write_only=True)
+    started = time.time()
+    for seq in range(messages):
+        publisher._publish({
+            'method': 'emit', 'event': 'bench', 'data': [{'seq': seq, 'sent_at': time.time()}],
+            'binary': False, 'namespace': '/', 'room': None, 'skip_sid': None,
+            'callback': None, 'host_id': 'bench-publisher',
+        })
+        if rate:
+            time.sleep(1.0 / rate)
+    publish_seconds = time.time() - started
+
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get(timeout=timeout + 5))
+    for process in processes:
+        process.join()
+
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+    return {
+        'queue': url.split('://')[0],
+        'workers': workers,
+        'messages': messages,
+        'delivered': len(latencies),
+        'expected': messages * workers,
+        'publish_rate': round(messages / publish_seconds, 1) if publish_seconds else None,
+        'latency_ms': {name: to_ms(percentile(latencies, pct))
+                       for name, pct in (('p50', 50), ('p95', 95), ('p99', 99))},
+        'max_ms': to_ms(max(latencies) if latencies else None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queue', default=os.environ.get('SOCKETIO_MESSAGE_QUEUE',
+                                                          'sqlite:////tmp/socketio-bench.db'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200, help='emits per second (0 = unthrottled)')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+    print(json.dumps(run(args.queue, args.workers, args.messages, args.rate, args.timeout), indent=2))
+
+
+if __name__ == '__main__':
+    main()
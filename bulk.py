@@ -0,0 +1,131 @@
+"""Set-based bulk ticket updates for admins.
+
+A selection (explicit ids or list filters) is walked in id order, in keyset
+chunks of ``BULK_CHUNK_SIZE``, with one ``UPDATE ... WHERE id IN`` per
+chunk, all inside a single transaction. Core updates skip the ORM hooks,
+so each chunk also adjusts the analytics counters, and the updated tickets
+are logged for the ticket list versions explicitly. The commit queues a
+job that sends clients one aggregated ``ticket_diff`` per room (or a
+reload hint when the change is too large to send row by row).
+"""
+from collections import Counter
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import func, or_, select, update
+
+from app import db
+from analytics import adjust, group_key
+from changelog import ACTION_UPDATE, last_version, record_many
+from listing import FILTER_COLUMNS, UNASSIGNED
+from models import Ticket, User, TICKET_STATUSES, TICKET_PRIORITIES
+
+def parse_changes(data):
+    """Validate the requested ``status``/``priority``/``assigned_to`` changes; raise ValueError."""
+    changes = {}
+    status = (data.get('status') or '').strip()
+    if status:
+        if status not in TICKET_STATUSES:
+            raise ValueError(f'Unknown status {status!r}.')
+        changes['status'] = status
+    priority = (data.get('priority') or '').strip()
+    if priority:
+        if priority not in TICKET_PRIORITIES:
+            raise ValueError(f'Unknown priority {priority!r}.')
+        changes['priority'] = priority
+    if 'assigned_to' in data:
+        # '' leaves the assignee alone; 'none' (or JSON null) unassigns
+        assigned_to = data['assigned_to']
+        assigned_to = UNASSIGNED if assigned_to is None else str(assigned_to).strip()
+        if assigned_to == UNASSIGNED:
+            changes['assigned_to'] = None
+        elif assigned_to.isdigit() and db.session.get(User, int(assigned_to)) is not None:
+            changes['assigned_to'] = int(assigned_to)
+        elif assigned_to:
+            raise ValueError(f'Unknown assignee {assigned_to!r}.')
+    if not changes:
+        raise ValueError('Nothing to change.')
+    return changes
+
+
+def selection(ids=None, filters=None):
+    """SELECT of the ticket ids named explicitly or matching ``filters``."""
+    query = select(Ticket.id)
+    if ids is not None:
+        query = query.where(Ticket.id.in_(ids))
+    for name, value in (filters or {}).items():
+        column = FILTER_COLUMNS[name]
+        query = query.where(column.is_(None) if value == UNASSIGNED else column == value)
+    return query
+
+
+def _chunks(query, chunk_size):
+    """Walk the ids ``query`` selects in id order, ``chunk_size`` at a time."""
+    last_id = 0
+    while True:
+        chunk = db.session.scalars(query.where(Ticket.id > last_id).order_by(Ticket.id).limit(chunk_size)).all()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+
+def _day(value):
+    # func.date() comes back as a string on SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _update_chunk(connection, chunk, changes, now):
+    """Apply ``changes`` to the tickets in ``chunk``; return ``[(id, owner_id)]`` updated."""
+    differs = or_(*(getattr(Ticket, field).is_distinct_from(value) for field, value in changes.items()))
+    rows = connection.execute(
+        select(Ticket.id, Ticket.user_id, func.date(Ticket.created_at).label('day'),
+               Ticket.status, Ticket.priority, Ticket.assigned_to)
+        .where(Ticket.id.in_(chunk), differs).with_for_update()
+    ).all()
+    if not rows:
+        return []
+    connection.execute(update(Ticket).where(Ticket.id.in_([row.id for row in rows]))
+                       .values(updated_at=now, **changes))
+
+    deltas = Counter()
+    for row in rows:
+        old = {'status': row.status, 'priority': row.priority, 'assigned_to': row.assigned_to}
+        new = dict(old, **changes)
+        day = _day(row.day)
+        deltas[group_key(day, old['status'], old['priority'], old['assigned_to'])] -= 1
+        deltas[group_key(day, new['status'], new['priority'], new['assigned_to'])] += 1
+    for key, delta in deltas.items():
+        if delta:
+            adjust(connection, key, delta)
+
+    return [(row.id, row.user_id) for row in rows]
+
+
+def bulk_update(query, changes, progress=None):
+    """Apply ``changes`` to every ticket ``query`` selects in one transaction.
+
+    ``query`` comes from ``selection()``; its ids are walked in keyset
+    chunks rather than loaded up front. ``progress(done, total, updated)``
+    is called after each chunk. Returns ``{'matched', 'updated',
+    'version'}``; tickets that already had the requested values are matched
+    but not updated.
+    """
+    chunk_size = current_app.config['BULK_CHUNK_SIZE']
+    now = datetime.utcnow()
+    connection = db.session.connection()
+    total = db.session.scalar(select(func.count()).select_from(query.subquery()))
+    matched = 0
+    updated = []
+    try:
+        for chunk in _chunks(query, chunk_size):
+            matched += len(chunk)
+            updated.extend(_update_chunk(connection, chunk, changes, now))
+            if progress:
+                progress(matched, total, len(updated))
+        changes = record_many(db.session, updated, ACTION_UPDATE)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'matched': matched, 'updated': len(updated), 'version': last_version(changes)}
@@ -0,0 +1,233 @@
+"""Ticket list versions and deltas.
+
+Every change that can alter a ticket list appends a ``TicketChange`` row in
+the same flush. The highest change id a user can see is their list
+version: it keys the rendered-fragment cache and ETags, and clients that
+know a version can ask for just the rows changed since. Changes are also
+pushed to connected clients as ``ticket_diff`` events by a
+``realtime.ticket_diffs`` job queued in the same transaction.
+
+That only works if versions become visible in order: a client that has
+seen version N must never miss a lower one that commits later. Database
+autoincrement ids are handed out at insert time, so a slow transaction
+could do exactly that. Instead ``record()`` only queues a change; at
+``before_commit``, after everything else in the transaction has been
+flushed, the queued changes take consecutive ids from the single
+``TicketChangeCounter`` row (one ``UPDATE ... RETURNING``) and are
+inserted along with the push job. The row lock that UPDATE takes is held until the COMMIT, so the
+next writer gets higher ids only once the earlier ones are committed (or
+rolled back), yet writers wait on each other only for those last
+statements, not for the whole of a bulk update or archive batch.
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_request_context, url_for
+from flask.cli import AppGroup
+from sqlalchemy import DDL, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import object_session
+
+from app import db
+from jobs import enqueue
+from listing import filtered_query
+from models import Ticket, TicketReply, TicketChange, TicketChangeCounter
+
+ACTION_INSERT = 'insert'
+ACTION_UPDATE = 'update'
+ACTION_REMOVE = 'remove'
+# Ticket columns shown in lists; changing anything else does not bump versions
+LISTED_FIELDS = ('subject', 'status', 'priority', 'assigned_to', 'user_id')
+
+
+COUNTER_ID = 1
+
+event.listen(TicketChangeCounter.__table__, 'after_create',
+             DDL(f'INSERT INTO ticket_change_counter (id, value) VALUES ({COUNTER_ID}, 0)'))
+
+
+def record(session, ticket_id, owner_id, action):
+    """Queue a change for the current transaction and return it.
+
+    Its ``version`` is filled in by ``_assign_versions`` just before commit.
+    """
+    change = {'ticket_id': ticket_id, 'owner_id': owner_id, 'action': action, 'created_at': datetime.utcnow()}
+    session.info.setdefault('ticket_changes', []).append(change)
+    return change
+
+
+def record_many(session, rows, action):
+    """Queue ``action`` for many ``(ticket_id, owner_id)`` pairs; return the changes.
+
+    Set-based writes skip the ORM hooks, so the batch is pushed to clients
+    as a whole by a ``realtime.ticket_changes`` job.
+    """
+    changes = [record(session, ticket_id, owner_id, action) for ticket_id, owner_id in rows]
+    if changes:
+        session.info.setdefault('ticket_batches', []).append((action, changes))
+    return changes
+
+
+def last_version(changes):
+    """Version of the newest of ``changes`` once committed, else the latest version overall."""
+    if changes:
+        return changes[-1]['version']
+    return db.session.scalar(select(func.max(TicketChange.id))) or 0
+
+
+@event.listens_for(db.session, 'before_commit')
+def _assign_versions(session):
+    # Write everything else first: the counter row stays locked from the
+    # UPDATE below until the COMMIT, see the module docstring.
+    session.flush()
+    changes = session.info.pop('ticket_changes', None)
+    if not changes:
+        return
+    counter = TicketChangeCounter.__table__
+    connection = session.connection()
+    last = connection.scalar(update(counter).where(counter.c.id == COUNTER_ID)
+                             .values(value=counter.c.value + len(changes)).returning(counter.c.value))
+    for version, change in enumerate(changes, last - len(changes) + 1):
+        change['version'] = version
+    connection.execute(insert(TicketChange), [
+        {'id': change['version'], 'ticket_id': change['ticket_id'], 'owner_id': change['owner_id'],
+         'action': change['action'], 'created_at': change['created_at']}
+        for change in changes
+    ])
+    for action, batch in session.info.pop('ticket_batches', ()):
+        version = batch[-1]['version']
+        if len(batch) > current_app.config['TICKET_CHANGES_MAX']:
+            enqueue('realtime.ticket_changes', version=version, action=action,
+                    owner_ids=sorted({change['owner_id'] for change in batch if change['owner_id'] is not None}))
+        else:
+            enqueue('realtime.ticket_changes', version=version, action=action,
+                    rows=[[change['ticket_id'], change['owner_id']] for change in batch])
+    pending = session.info.pop('ticket_diffs', None)
+    if pending:
+        enqueue('realtime.ticket_diffs', changes=[{
+            'version': change['version'], 'action': change['action'], 'id': change['ticket_id'],
+            'owner_id': change['owner_id'], 'ticket': ticket,
+        } for change, ticket in pending])
+
+
+def ticket_row(ticket):
+    """The list-row data sent to clients for ``ticket``."""
+    row = ticket.to_dict()
+    if has_request_context():
+        row['url'] = url_for('routes.ticket_detail', ticket_id=ticket.id)
+    return row
+
+
+# Changes made through the ORM are pushed to clients by a job queued at commit.
+
+def _pending(session):
+    return session.info.setdefault('ticket_diffs', [])
+
+
+def _push(target, change, ticket=None):
+    _pending(object_session(target)).append((change, ticket_row(ticket) if ticket is not None else None))
+
+
+@event.listens_for(Ticket, 'after_insert')
+def _ticket_inserted(mapper, connection, ticket):
+    _push(ticket, record(object_session(ticket), ticket.id, ticket.user_id, ACTION_INSERT), ticket)
+
+
+@event.listens_for(Ticket, 'after_update')
+def _ticket_updated(mapper, connection, ticket):
+    state = inspect(ticket)
+    if any(state.attrs[field].history.has_changes() for field in LISTED_FIELDS):
+        _push(ticket, record(object_session(ticket), ticket.id, ticket.user_id, ACTION_UPDATE), ticket)
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _ticket_deleted(mapper, connection, ticket):
+    _push(ticket, record(object_session(ticket), ticket.id, ticket.user_id, ACTION_REMOVE))
+
+
+@event.listens_for(TicketReply, 'after_insert')
+def _reply_inserted(mapper, connection, reply):
+    owner_id = connection.scalar(select(Ticket.user_id).where(Ticket.id == reply.ticket_id))
+    # The row itself looks the same; clients only move their version on.
+    _push(reply, record(object_session(reply), reply.ticket_id, owner_id, ACTION_UPDATE))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_diffs(session):
+    session.info.pop('ticket_changes', None)
+    session.info.pop('ticket_batches', None)
+    session.info.pop('ticket_diffs', None)
+
+
+def _visible(query, user):
+    if not user.is_admin():
+        query = query.where(TicketChange.owner_id == user.id)
+    return query
+
+
+def current_version(user):
+    """Highest change id that can affect ``user``'s ticket lists (0 if none)."""
+    return db.session.scalar(_visible(select(func.max(TicketChange.id)), user)) or 0
+
+
+def changes_since(user, since, filters):
+    """Rows changed after version ``since`` as ``{'version', 'changes'}``.
+
+    Returns ``None`` when the client has to reload the whole list instead:
+    too many changes, or ``since`` predates the retained log.
+    """
+    limit = current_app.config['TICKET_CHANGES_MAX']
+    oldest = db.session.scalar(select(func.min(TicketChange.id)))
+    if since < 0 or (oldest is not None and since < oldest - 1):
+        return None
+    rows = db.session.execute(
+        _visible(select(TicketChange.id, TicketChange.ticket_id, TicketChange.action), user)
+        .where(TicketChange.id > since).order_by(TicketChange.id).limit(limit + 1)
+    ).all()
+    if len(rows) > limit:
+        return None
+    version = rows[-1].id if rows else max(since, current_version(user))
+
+    first_action, last_action = {}, {}
+    for row in rows:
+        first_action.setdefault(row.ticket_id, row.action)
+        last_action[row.ticket_id] = row.action
+    live = [ticket_id for ticket_id, action in last_action.items() if action != ACTION_REMOVE]
+    tickets = {}
+    if live:
+        tickets = {ticket.id: ticket for ticket in filtered_query(filters).filter(Ticket.id.in_(live))}
+
+    changes = []
+    for ticket_id in last_action:
+        ticket = tickets.get(ticket_id)
+        if ticket is None:
+            changes.append({'action': ACTION_REMOVE, 'id': ticket_id})
+            continue
+        action = ACTION_INSERT if first_action[ticket_id] == ACTION_INSERT else ACTION_UPDATE
+        changes.append({
+            'action': action,
+            'id': ticket_id,
+            'ticket': ticket_row(ticket),
+        })
+    return {'version': version, 'changes': changes}
+
+
+def prune(before):
+    """Drop change rows older than ``before``, always keeping the newest one."""
+    newest = db.session.scalar(select(func.max(TicketChange.id)))
+    if newest is None:
+        return 0
+    result = db.session.execute(delete(TicketChange).where(
+        TicketChange.created_at < before, TicketChange.id < newest))
+    db.session.commit()
+    return result.rowcount
+
+
+changelog_cli = AppGroup('changelog', help='Ticket list change log.')
+
+
+@changelog_cli.command('prune')
+@click.option('--days', default=7, show_default=True, help='Keep changes from the last N days.')
+def prune_command(days):
+    """Remove old change rows; clients older than that reload their list."""
+    removed = prune(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Removed {removed} change rows.")
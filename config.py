@@ -9,18 +9,147 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', f"sqlite:///{os.path.join(basedir, 'app.db')}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool (not used for in-memory SQLite). Sized for many green
+    # threads sharing a few connections: when all are busy, callers queue for
+    # up to DB_POOL_TIMEOUT seconds. Explicit SQLALCHEMY_ENGINE_OPTIONS win.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = True
+    # SQLite files: journal mode set on every connection (empty leaves it
+    # alone) and how long a writer waits on a lock, in milliseconds
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'wal')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    # Optional read replica; views marked @database.read_only read from it
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+
     # File uploads
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'zip'}
+    # None streams from the app; 'x-accel' (nginx) or 'x-sendfile' (Apache,
+    # lighttpd) hand the transfer to the front proxy.
+    ATTACHMENT_SENDFILE = os.environ.get('ATTACHMENT_SENDFILE') or None
+    # nginx `internal` location aliased to UPLOAD_FOLDER, used with 'x-accel'
+    ATTACHMENT_ACCEL_PREFIX = os.environ.get('ATTACHMENT_ACCEL_PREFIX', '/protected-uploads/')
+    ATTACHMENT_MAX_AGE = 3600
+    # Attachment previews (thumbnails.py): longest edge in pixels, JPEG
+    # quality, and browser cache lifetime (previews never change)
+    THUMBNAIL_SIZE = 320
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+    # Previews rendered at once per process, on OS threads
+    THUMBNAIL_WORKERS = 2
+    # Resumable uploads are sent in chunks of this size
+    UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+    MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+    # Unfinished resumable uploads a user may hold (each up to MAX_UPLOAD_SIZE)
+    UPLOAD_MAX_SESSIONS = 5
+
+    # Ticket listing pagination
+    TICKETS_PER_PAGE = 25
+    TICKETS_MAX_PER_PAGE = 100
+    # Rendered ticket-list fragments: memory:// (per-process LRU, default),
+    # redis://host:6379/1 (shared) or null:// (off)
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')
+    FRAGMENT_CACHE_SIZE = 1000
+    FRAGMENT_CACHE_TTL = 300
+    # Deltas larger than this tell the client to reload the list instead
+    TICKET_CHANGES_MAX = 200
+    # Tickets updated per UPDATE statement by admin bulk operations
+    BULK_CHUNK_SIZE = 500
+    # Tickets moved per transaction by `flask tickets archive`
+    ARCHIVE_BATCH_SIZE = 500
+
+    # Background jobs (jobs.py): 'inline' runs them right after the commit
+    # (tests), 'background' in a background task of the web process, and
+    # 'worker' leaves them to `flask worker`. Failed jobs are retried after
+    # JOBS_RETRY_BASE * 2**(attempt - 1) seconds, capped at JOBS_RETRY_MAX.
+    JOBS_MODE = os.environ.get('JOBS_MODE', 'background')
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_RETRY_BASE = 2.0
+    JOBS_RETRY_MAX = 600
+    # Running jobs locked longer than this (seconds) are assumed abandoned
+    JOBS_LOCK_TIMEOUT = 300
+    JOBS_POLL_INTERVAL = 1.0
+    JOBS_BATCH_SIZE = 50
+    # Ticket lists are patched from pushed ticket_diff events; set this to a
+    # number of seconds to also poll for deltas (e.g. behind proxies that
+    # block WebSockets and long-polling). 0 disables polling.
+    TICKET_LIST_POLL_INTERVAL = int(os.environ.get('TICKET_LIST_POLL_INTERVAL', 0))
+    # Private message history and conversation list pagination
+    MESSAGES_PER_PAGE = 30
+    MESSAGES_MAX_PER_PAGE = 100
+
+    # Ticket detail replies and audit log viewer pagination
+    REPLIES_PER_PAGE = 20
+    REPLIES_MAX_PER_PAGE = 100
+    AUDIT_LOGS_PER_PAGE = 50
+    AUDIT_LOGS_MAX_PER_PAGE = 200
+
+    # Audit entries are queued and written in batches of AUDIT_BATCH_SIZE or
+    # every AUDIT_FLUSH_INTERVAL seconds; AUDIT_ASYNC = False writes each one
+    # immediately. Callers block on a flush once AUDIT_QUEUE_MAX are waiting.
+    AUDIT_ASYNC = True
+    AUDIT_BATCH_SIZE = 100
+    AUDIT_FLUSH_INTERVAL = 2.0
+    AUDIT_QUEUE_MAX = 10000
+    AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR') or os.path.join(basedir, 'archive', 'audit')
+
+    # Per-request SQL statement budget (None disables it); views can
+    # override it with instrumentation.query_budget. Raises under TESTING.
+    SQL_QUERY_BUDGET = int(os.environ['SQL_QUERY_BUDGET']) if os.environ.get('SQL_QUERY_BUDGET') else None
+    # Report the statement count in an X-SQL-Queries response header
+    SQL_QUERY_COUNT_HEADER = False
+    # Log requests slower than this (milliseconds, None disables) with their
+    # SLOW_REQUEST_STATEMENTS slowest SQL statements
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000)) or None
+    SLOW_REQUEST_STATEMENTS = 5
+    # Bearer token that lets a Prometheus scraper read /metrics without an admin session
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Full-text search
+    SEARCH_RESULTS_PER_PAGE = 20
+    # PostgreSQL text search configuration used for tsvector/tsquery
+    SEARCH_LANGUAGE = os.environ.get('SEARCH_LANGUAGE', 'english')
+
+    # Compiled permission sets kept per process
+    PERMISSION_CACHE_SIZE = 10000
+
+    # Logged-in user snapshots kept per process (seconds before a reload)
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 30
 
     # Session Lifetime
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=30)
 
+    # Passwords: algorithm and cost of new hashes (werkzeug method string)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    # 'pool' hashes on OS threads so the event loop keeps serving; 'inline' hashes in the caller
+    PASSWORD_HASH_POOL = os.environ.get('PASSWORD_HASH_POOL', 'pool')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+
     # Rate Limiting
     RATELIMIT_DEFAULT = "200 per day;50 per hour"
+    # Shared counters so limits hold across workers: redis://host:6379/1, memcached://...
+    # Defaults to the Socket.IO Redis queue when there is one, else per-process memory.
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or (
+        os.environ['SOCKETIO_MESSAGE_QUEUE'] if os.environ.get('SOCKETIO_MESSAGE_QUEUE', '').startswith('redis')
+        else 'memory://')
+    # Keep limiting per process if the shared storage is unreachable
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True
+    # Login attempts per client address, and per username across addresses
+    LOGIN_RATE_LIMIT = os.environ.get('LOGIN_RATE_LIMIT', '10 per minute')
+    LOGIN_USERNAME_RATE_LIMIT = os.environ.get('LOGIN_USERNAME_RATE_LIMIT', '20 per hour')
 
     # Logging
     LOG_FILE = os.path.join(basedir, 'logs', 'app.log')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
 
     # SocketIO
     SOCKETIO_ASYNC_MODE = 'eventlet'
+    # Shared pub/sub backend for running several workers: redis://host:6379/0,
+    # sqlite:///path/to/socketio.db (single machine) or memory:// (tests).
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
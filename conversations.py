@@ -0,0 +1,164 @@
+from datetime import datetime
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from sqlalchemy import and_, event, func, insert, literal, or_, select, union_all, update
+
+from app import db
+from database import upsert
+from models import User, Message, Conversation
+from thumbnails import has_thumbnail
+from utils import encode_cursor, decode_cursor
+
+PREVIEW_LENGTH = 100
+
+
+def _touch(connection, user_id, peer_id, message, unread_delta):
+    values = {
+        'last_message_id': message.id,
+        'last_message_at': message.timestamp or datetime.utcnow(),
+        'last_preview': message.body[:PREVIEW_LENGTH],
+    }
+    # One statement, so two first messages between a pair cannot both insert
+    connection.execute(
+        upsert(connection, Conversation)
+        .values(user_id=user_id, peer_id=peer_id, unread_count=unread_delta, **values)
+        .on_conflict_do_update(index_elements=['user_id', 'peer_id'],
+                               set_=dict(unread_count=Conversation.unread_count + unread_delta, **values))
+    )
+
+
+@event.listens_for(Message, 'after_insert')
+def _message_inserted(mapper, connection, message):
+    _touch(connection, message.sender_id, message.recipient_id, message, 0)
+    if message.recipient_id != message.sender_id:
+        _touch(connection, message.recipient_id, message.sender_id, message, 1)
+
+
+def _page_limit(limit):
+    default = current_app.config['MESSAGES_PER_PAGE']
+    try:
+        limit = int(limit or default)
+    except ValueError:
+        limit = default
+    return max(1, min(limit, current_app.config['MESSAGES_MAX_PER_PAGE']))
+
+
+def _keyset(query, timestamp_column, id_column, cursor):
+    if not cursor:
+        return query
+    timestamp, row_id = decode_cursor(cursor)
+    return query.filter(or_(timestamp_column < timestamp,
+                            and_(timestamp_column == timestamp, id_column < row_id)))
+
+
+def list_conversations(user_id, cursor=None, limit=None):
+    """The user's threads, most recently active first, one keyset page at a time."""
+    limit = _page_limit(limit)
+    query = Conversation.query.options(db.joinedload(Conversation.peer)) \
+        .filter(Conversation.user_id == user_id)
+    query = _keyset(query, Conversation.last_message_at, Conversation.id, cursor)
+    rows = query.order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].last_message_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def conversation_history(user_id, peer_id, cursor=None, limit=None):
+    """Messages between the pair, newest first, one keyset page at a time."""
+    limit = _page_limit(limit)
+    query = Message.query.filter(or_(
+        and_(Message.sender_id == user_id, Message.recipient_id == peer_id),
+        and_(Message.sender_id == peer_id, Message.recipient_id == user_id),
+    ))
+    query = _keyset(query, Message.timestamp, Message.id, cursor)
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].timestamp, messages[-1].id)
+    return messages, next_cursor
+
+
+def mark_read(user_id, peer_id):
+    db.session.execute(
+        update(Conversation)
+        .where(Conversation.user_id == user_id, Conversation.peer_id == peer_id)
+        .values(unread_count=0)
+    )
+    db.session.commit()
+
+
+def unread_total(user_id):
+    return db.session.query(func.coalesce(func.sum(Conversation.unread_count), 0)) \
+        .filter(Conversation.user_id == user_id).scalar()
+
+
+def search_users(term, exclude_id, limit=10):
+    """Username prefix search as an index range scan rather than LIKE."""
+    term = (term or '').strip()
+    if not term:
+        return []
+    return User.query.filter(
+        User.username >= term,
+        User.username < term + '\uffff',
+        User.id != exclude_id,
+    ).order_by(User.username).limit(limit).all()
+
+
+def rebuild():
+    """Recompute every conversation summary from the message table; unread counts reset."""
+    directed = union_all(
+        select(Message.sender_id.label('user_id'), Message.recipient_id.label('peer_id'), Message.id)
+        .where(Message.sender_id.isnot(None), Message.recipient_id.isnot(None)),
+        select(Message.recipient_id, Message.sender_id, Message.id)
+        .where(Message.sender_id.isnot(None), Message.recipient_id.isnot(None),
+               Message.sender_id != Message.recipient_id),
+    ).subquery()
+    latest = select(directed.c.user_id, directed.c.peer_id, func.max(directed.c.id).label('last_id')) \
+        .group_by(directed.c.user_id, directed.c.peer_id).subquery()
+    rows = select(latest.c.user_id, latest.c.peer_id, Message.id, Message.timestamp,
+                  func.substr(Message.body, 1, PREVIEW_LENGTH), literal(0)) \
+        .join(Message, Message.id == latest.c.last_id)
+    db.session.execute(Conversation.__table__.delete())
+    db.session.execute(insert(Conversation).from_select(
+        ['user_id', 'peer_id', 'last_message_id', 'last_message_at', 'last_preview', 'unread_count'], rows))
+    db.session.commit()
+    return db.session.query(func.count(Conversation.id)).scalar()
+
+
+def message_to_dict(message):
+    return {
+        'id': message.id,
+        'body': message.body,
+        'sender_id': message.sender_id,
+        'recipient_id': message.recipient_id,
+        'timestamp': message.timestamp.isoformat(),
+        'attachment_url': url_for('routes.uploaded_file', filename=message.attachment)
+        if message.attachment else None,
+        'thumbnail_url': url_for('routes.attachment_thumbnail', filename=message.attachment)
+        if has_thumbnail(message.attachment) else None,
+    }
+
+
+def conversation_to_dict(conversation):
+    return {
+        'peer_id': conversation.peer_id,
+        'peer': conversation.peer.username if conversation.peer else None,
+        'last_message_at': conversation.last_message_at.isoformat() if conversation.last_message_at else None,
+        'last_preview': conversation.last_preview,
+        'unread_count': conversation.unread_count,
+    }
+
+
+conversations_cli = AppGroup('conversations', help='Private-message thread summaries.')
+
+
+@conversations_cli.command('rebuild')
+def rebuild_command():
+    """Recompute thread summaries from the message table to repair drift (unread counts reset)."""
+    threads = rebuild()
+    click.echo(f"Rebuilt {threads} conversation summaries.")
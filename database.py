@@ -0,0 +1,149 @@
+"""Engine configuration, SQLite pragmas and read-replica routing.
+
+``configure(app)`` turns the ``DB_POOL_*``/``SQLITE_*`` settings into
+engine options before Flask-SQLAlchemy creates its engines (explicit
+``SQLALCHEMY_ENGINE_OPTIONS`` still win) and adds a ``replica`` bind when
+``SQLALCHEMY_REPLICA_URI`` is set. Views decorated with ``@read_only``
+send their SELECTs to the replica; writes, flushes and every other view
+stay on the primary. Without a replica the decorator does nothing.
+
+Pools time how long each checkout waits for a connection and export that,
+with pool occupancy, through the ``/metrics`` registry.
+"""
+import time
+from functools import partial, wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+
+from instrumentation import SQL_BUCKETS, registry
+
+REPLICA_BIND = 'replica'
+
+POOL_WAIT = registry.histogram('db_pool_checkout_wait_seconds',
+                               'Time spent waiting for a pooled connection.', ('bind',), SQL_BUCKETS)
+POOL_TIMEOUTS = registry.counter('db_pool_checkout_timeouts_total',
+                                 'Checkouts that gave up after DB_POOL_TIMEOUT.', ('bind',))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkout wait time under ``bind_name``."""
+    bind_name = 'default'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc(bind=self.bind_name)
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, bind=self.bind_name)
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri, config, bind_name='default'):
+    """Engine keyword arguments for ``uri`` built from the pool settings in ``config``."""
+    url = make_url(uri)
+    if _is_sqlite_memory(url):
+        # Flask-SQLAlchemy gives in-memory databases a single shared connection
+        return {}
+    # A subclass per bind keeps the label when SQLAlchemy recreates the pool
+    pool_class = type(f'TimedQueuePool_{bind_name}', (TimedQueuePool,), {'bind_name': bind_name})
+    options = {
+        'poolclass': pool_class,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        # Reuse the most recently returned connection so idle ones can expire
+        'pool_use_lifo': True,
+    }
+    if url.get_backend_name() != 'sqlite':
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+        options['pool_pre_ping'] = config['DB_POOL_PRE_PING']
+    return options
+
+
+def configure(app):
+    """Fill in engine options and the replica bind; call before ``db.init_app``."""
+    config = app.config
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+        engine_options(config['SQLALCHEMY_DATABASE_URI'], config),
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    replica = config.get('SQLALCHEMY_REPLICA_URI')
+    if replica:
+        binds = config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, dict(engine_options(replica, config, REPLICA_BIND), url=replica))
+
+
+def _sqlite_pragmas(journal_mode, busy_timeout, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+    if journal_mode:
+        cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+        if journal_mode.lower() == 'wal':
+            # Durable across application crashes; only an OS crash can lose the last commits
+            cursor.execute('PRAGMA synchronous = NORMAL')
+    cursor.close()
+
+
+def _pool_samples(engines):
+    for key, engine in engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            yield {'bind': key or 'default', 'state': 'checked_out'}, pool.checkedout()
+            yield {'bind': key or 'default', 'state': 'idle'}, pool.checkedin()
+            yield {'bind': key or 'default', 'state': 'overflow'}, max(pool.overflow(), 0)
+
+
+def init_app(app):
+    """Attach pragmas and pool gauges to the engines ``db.init_app`` created."""
+    from app import db
+    with app.app_context():
+        engines = dict(db.engines)
+    for engine in engines.values():
+        if engine.dialect.name == 'sqlite' and not _is_sqlite_memory(engine.url):
+            event.listen(engine, 'connect', partial(
+                _sqlite_pragmas, app.config['SQLITE_JOURNAL_MODE'], app.config['SQLITE_BUSY_TIMEOUT']))
+    registry.gauge('db_pool_connections', 'Pooled connections by state.', partial(_pool_samples, engines))
+
+
+# Read-replica routing
+
+def _reading_replica():
+    return has_app_context() and g.get('db_read_only', False)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and not self._flushing and _reading_replica():
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Serve the view's queries from the read replica, if one is configured."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.db_read_only = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.db_read_only = False
+    return wrapped
+
+
+def upsert(connection, model):
+    """``INSERT`` for ``model`` with ``on_conflict_do_update`` on SQLite and PostgreSQL."""
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
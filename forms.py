@@ -1,5 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, TextAreaField, SubmitField, FileField, SelectField, BooleanField
+from wtforms import IntegerField, StringField, PasswordField, TextAreaField, SubmitField, FileField, SelectField, BooleanField, HiddenField
+from wtforms.widgets import HiddenInput
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional
 
 class LoginForm(FlaskForm):
@@ -26,17 +27,20 @@ class TicketForm(FlaskForm):
     subject = StringField('Subject', validators=[DataRequired(), Length(1, 200)])
     description = TextAreaField('Description', validators=[DataRequired()])
     attachment = FileField('Attachment', validators=[Optional()])
+    upload_id = HiddenField()
     submit = SubmitField('Create Ticket')
 
 class TicketReplyForm(FlaskForm):
     message = TextAreaField('Message', validators=[DataRequired()])
     attachment = FileField('Attachment', validators=[Optional()])
+    upload_id = HiddenField()
     submit = SubmitField('Submit Reply')
 
 class PrivateMessageForm(FlaskForm):
-    recipient = SelectField('Recipient', coerce=int, validators=[DataRequired()])
+    recipient = IntegerField('Recipient', widget=HiddenInput(), validators=[DataRequired()])
     body = TextAreaField('Message', validators=[DataRequired()])
     attachment = FileField('Attachment', validators=[Optional()])
+    upload_id = HiddenField()
     submit = SubmitField('Send Message')
 
 class UserPermissionsForm(FlaskForm):
@@ -46,3 +50,7 @@ class UserPermissionsForm(FlaskForm):
     can_edit_ticket = BooleanField('Can Edit Tickets')
     can_delete_ticket = BooleanField('Can Delete Tickets')
     submit = SubmitField('Update Permissions')
+
+class BulkTicketForm(FlaskForm):
+    # The changes themselves are validated by bulk.parse_changes
+    all = BooleanField('Apply to every ticket')
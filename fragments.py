@@ -0,0 +1,98 @@
+"""Rendered-fragment cache with pluggable backends.
+
+``FRAGMENT_CACHE_URL`` picks the backend: unset or ``memory://`` for a
+per-process LRU, ``redis://...`` to share fragments between workers, or
+``null://`` to disable caching.
+"""
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LRUFragmentCache:
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        # Keys carry the list version, so stale entries simply age out.
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'backend': 'memory', 'size': len(self._entries), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class RedisFragmentCache:
+    def __init__(self, url, prefix='fragment:'):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, value.encode('utf-8'), ex=ttl)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+class NullFragmentCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'null'}
+
+
+def cache_from_url(url, maxsize=1000):
+    if not url or url.startswith('memory://'):
+        return LRUFragmentCache(maxsize)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisFragmentCache(url)
+    if url.startswith('null://'):
+        return NullFragmentCache()
+    raise ValueError(f'Unsupported FRAGMENT_CACHE_URL: {url}')
+
+
+def init_app(app):
+    app.extensions['fragment_cache'] = cache_from_url(
+        app.config['FRAGMENT_CACHE_URL'], app.config['FRAGMENT_CACHE_SIZE'])
+
+
+def fragment_cache():
+    return current_app.extensions['fragment_cache']
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from app import db
+from models import User, Role, Permission, ADMIN_ROLES
+from permissions import LEGACY_FLAGS, effective_permissions
+
+SNAPSHOT_FIELDS = ('id', 'username', 'email', 'full_name', 'role', 'role_id', 'perm_version') \
+    + tuple(LEGACY_FLAGS)
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of the logged-in user, served from the identity cache.
+
+    Use ``load()`` to get the ORM ``User`` when the row must be modified.
+    """
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            setattr(self, field, getattr(user, field))
+        self.permissions = effective_permissions(user)
+
+    def load(self):
+        return db.session.get(User, self.id)
+
+    def is_admin(self):
+        return self.role in ADMIN_ROLES
+
+    def can_access_ticket(self, ticket):
+        return self.is_admin() or ticket.user_id == self.id
+
+    def has_permission(self, perm_name):
+        return perm_name in self.permissions
+
+    def effective_permissions(self):
+        return self.permissions
+
+    def get_effective_permissions(self):
+        return sorted(self.permissions)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+class IdentityCache:
+    """Bounded LRU of user snapshots that expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=10000, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, snapshot):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+identity_cache = IdentityCache()
+
+
+def load_identity(user_id):
+    snapshot = identity_cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        identity_cache.put(user_id, snapshot)
+    return snapshot
+
+
+# Invalidate once the change is committed so a concurrent request cannot
+# re-cache the pre-commit row.
+def _pending(session):
+    return session.info.setdefault('identity_invalidations', set())
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    _pending(object_session(user)).add(user.id)
+
+
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+@event.listens_for(Permission, 'after_update')
+@event.listens_for(Permission, 'after_delete')
+def _grants_changed(mapper, connection, target):
+    _pending(object_session(target)).add(None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_invalidations(session):
+    pending = session.info.pop('identity_invalidations', None)
+    if not pending:
+        return
+    if None in pending:
+        identity_cache.clear()
+        return
+    for user_id in pending:
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('identity_invalidations', None)
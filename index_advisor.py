@@ -0,0 +1,79 @@
+import re
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, func, or_, select
+
+from app import db
+from models import Ticket, TicketReply, Message, AuditLog
+from listing import filtered_query
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?!.*USING (COVERING )?INDEX)')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on')
+
+
+def canonical_queries():
+    """The hot query shapes the views issue, with representative parameters."""
+    cursor_at = datetime.utcnow()
+    keyset = or_(Ticket.created_at < cursor_at, and_(Ticket.created_at == cursor_at, Ticket.id < 1000))
+    newest = (Ticket.created_at.desc(), Ticket.id.desc())
+    return [
+        ('ticket list (admin)', filtered_query({}).order_by(*newest).limit(26)),
+        ('ticket list (admin, next page)', filtered_query({}).filter(keyset).order_by(*newest).limit(26)),
+        ('ticket list (author)', filtered_query({'author': 1}).order_by(*newest).limit(26)),
+        ('ticket list (status)', filtered_query({'status': 'open'}).order_by(*newest).limit(26)),
+        ('ticket list (priority)', filtered_query({'priority': 'high'}).order_by(*newest).limit(26)),
+        ('ticket list (assignee)', filtered_query({'assignee': 1}).order_by(*newest).limit(26)),
+        ('ticket count by status', select(func.count()).select_from(Ticket).where(Ticket.status == 'open')),
+        ('ticket replies', TicketReply.query.filter_by(ticket_id=1).order_by(TicketReply.created_at)),
+        ('conversation history', Message.query.filter(or_(
+            and_(Message.sender_id == 1, Message.recipient_id == 2),
+            and_(Message.sender_id == 2, Message.recipient_id == 1),
+        )).order_by(Message.timestamp.desc()).limit(50)),
+        ('inbox', Message.query.filter_by(recipient_id=1).order_by(Message.timestamp.desc()).limit(50)),
+        ('audit log', AuditLog.query.order_by(AuditLog.timestamp.desc()).limit(50)),
+        ('audit log (user)', AuditLog.query.filter_by(user_id=1).order_by(AuditLog.timestamp.desc()).limit(50)),
+    ]
+
+
+def explain(connection, statement):
+    """Return the plan lines for ``statement`` on the connection's dialect."""
+    dialect = connection.dialect.name
+    if hasattr(statement, 'statement'):
+        statement = statement.statement
+    compiled = statement.compile(dialect=connection.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+        return [row[-1] for row in rows]
+    if dialect == 'postgresql':
+        rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params)
+        return [row[0] for row in rows]
+    raise click.ClickException(f"EXPLAIN is not supported for the {dialect} dialect.")
+
+
+def full_scans(dialect, plan):
+    pattern = SQLITE_FULL_SCAN if dialect == 'sqlite' else POSTGRES_FULL_SCAN
+    return [line for line in plan if pattern.search(line.strip())]
+
+
+@click.command('index-report')
+@click.option('--verbose', '-v', is_flag=True, help='Print the full plan for every query.')
+@with_appcontext
+def index_report(verbose):
+    """Explain the canonical queries and flag full table scans."""
+    flagged = 0
+    with db.engine.connect() as connection:
+        dialect = connection.dialect.name
+        for name, statement in canonical_queries():
+            plan = explain(connection, statement)
+            scans = full_scans(dialect, plan)
+            flagged += bool(scans)
+            click.echo(f"{'FULL SCAN' if scans else 'ok':<10} {name}")
+            for line in (plan if verbose else scans):
+                click.echo(f"           {line.strip()}")
+    if flagged:
+        raise click.ClickException(f"{flagged} queries use a full table scan.")
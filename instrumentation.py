@@ -0,0 +1,343 @@
+"""Per-request instrumentation: SQL counts and budgets, timings and metrics.
+
+Every statement executed while a request is active is counted and timed on
+``g``. With ``SQL_QUERY_BUDGET`` set, a request that runs more statements
+than the budget (or the view's own ``@query_budget(n)``) is reported: under
+``TESTING`` it raises ``QueryBudgetExceeded`` so the offending test fails,
+otherwise it is logged as a warning.
+
+Request latency, SQL time, template render time and Socket.IO emits are
+also aggregated into per-process histograms and counters, served in the
+Prometheus text format by the ``/metrics`` view. Requests slower than
+``SLOW_REQUEST_MS`` are logged as one JSON line with their slowest
+statements.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+# Longest statement text kept in slow logs
+STATEMENT_MAX_LENGTH = 500
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# Metrics
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the running sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def value(self, **labels):
+        """``(count, sum)`` observed for ``labels``."""
+        counts = self._values.get(tuple(labels.get(name, '') for name in self.labels))
+        return (sum(counts[:-1]), counts[-1]) if counts else (0, 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield self.name + '_bucket', dict(labels, le=bound), cumulative
+            yield self.name + '_sum', labels, round(counts[-1], 6)
+            yield self.name + '_count', labels, cumulative
+
+
+class Gauge:
+    """Value read at scrape time: ``collect()`` yields ``(labels, value)`` pairs."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect):
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, labels, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def gauge(self, name, help, collect):
+        # Re-registering replaces the callback (e.g. engines recreated by a new app)
+        gauge = self.metrics.setdefault(name, Gauge(name, help, collect))
+        gauge.collect = collect
+        return gauge
+
+    def counter(self, name, help, labels=()):
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def exposition(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_label_text(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+REQUESTS = registry.counter('http_requests_total', 'HTTP requests handled.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = registry.histogram('http_request_duration_seconds', 'Time spent handling a request.',
+                                     ('endpoint', 'method'))
+REQUEST_QUERIES = registry.histogram('http_request_sql_statements', 'SQL statements run per request.',
+                                     ('endpoint',), COUNT_BUCKETS)
+REQUEST_SQL_TIME = registry.histogram('http_request_sql_seconds', 'Time spent in SQL per request.',
+                                      ('endpoint',))
+SQL_LATENCY = registry.histogram('sql_statement_duration_seconds', 'Duration of single SQL statements.',
+                                 buckets=SQL_BUCKETS)
+RENDER_LATENCY = registry.histogram('template_render_seconds', 'Jinja template render time.',
+                                    ('template',))
+EMITS = registry.counter('socketio_emits_total', 'Socket.IO events emitted.', ('event',))
+SLOW_REQUESTS = registry.counter('http_slow_requests_total', 'Requests over SLOW_REQUEST_MS.',
+                                 ('endpoint',))
+
+
+# SQL
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+    if has_app_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        for counter in g.get('sql_counters', ()):
+            counter.statements.append(statement)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    SQL_LATENCY.observe(elapsed)
+    if has_app_context() and 'request_started' in g:
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+        g.setdefault('sql_timings', []).append((elapsed, statement))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_timing(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def query_count():
+    return g.get('sql_queries', 0)
+
+
+def query_budget(limit):
+    """Override ``SQL_QUERY_BUDGET`` for a single view."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            g.sql_query_budget = limit
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(limit=None):
+    """Collect the statements run inside the block; fail if more than ``limit``.
+
+    Meant for tests, e.g. ``with count_queries(5): client.get('/ticket/1')``
+    with an app context pushed around the request.
+    """
+    counter = QueryCounter()
+    g.sql_counters = g.get('sql_counters', ()) + (counter,)
+    try:
+        yield counter
+    finally:
+        g.sql_counters = tuple(c for c in g.sql_counters if c is not counter)
+    if limit is not None and counter.count > limit:
+        raise QueryBudgetExceeded(
+            f"{counter.count} SQL statements (budget {limit}):\n" + '\n'.join(counter.statements))
+
+
+# Templates
+
+class TimedTemplate(Template):
+    """Jinja template that records how long each top-level render takes.
+
+    Flask renders through ``Template.render``; includes and imports render
+    inside it, so they count towards the outer template.
+    """
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            RENDER_LATENCY.observe(elapsed, template=self.name or 'string')
+            if has_app_context():
+                g.render_time = g.get('render_time', 0.0) + elapsed
+
+
+# Socket.IO
+
+def instrument_emits(socketio):
+    """Count ``socketio.emit`` calls per event name."""
+    emit = socketio.emit
+    if getattr(emit, 'instrumented', False):
+        return
+
+    @wraps(emit)
+    def counted_emit(event, *args, **kwargs):
+        EMITS.inc(event=event)
+        return emit(event, *args, **kwargs)
+    counted_emit.instrumented = True
+    socketio.emit = counted_emit
+
+
+# Requests
+
+def _reset_counter():
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    g.sql_timings = []
+    g.render_time = 0.0
+    g.pop('sql_query_budget', None)
+
+
+def _slow_log(endpoint, response, elapsed):
+    config = current_app.config
+    slowest = sorted(g.get('sql_timings', ()), key=lambda timing: timing[0], reverse=True)
+    SLOW_REQUESTS.inc(endpoint=endpoint)
+    current_app.logger.warning('slow request %s', json.dumps({
+        'endpoint': endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 1),
+        'sql_statements': query_count(),
+        'sql_ms': round(g.get('sql_time', 0.0) * 1000, 1),
+        'render_ms': round(g.get('render_time', 0.0) * 1000, 1),
+        'slowest_statements': [
+            {'ms': round(duration * 1000, 2), 'statement': ' '.join(statement.split())[:STATEMENT_MAX_LENGTH]}
+            for duration, statement in slowest[:config['SLOW_REQUEST_STATEMENTS']]
+        ],
+    }))
+
+
+def _record_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_LATENCY.observe(elapsed, endpoint=endpoint, method=request.method)
+    REQUEST_QUERIES.observe(query_count(), endpoint=endpoint)
+    REQUEST_SQL_TIME.observe(g.get('sql_time', 0.0), endpoint=endpoint)
+    threshold = current_app.config['SLOW_REQUEST_MS']
+    if threshold is not None and elapsed * 1000 >= threshold:
+        _slow_log(endpoint, response, elapsed)
+    return response
+
+
+def _check_budget(response):
+    budget = g.get('sql_query_budget', current_app.config['SQL_QUERY_BUDGET'])
+    count = query_count()
+    if current_app.config['SQL_QUERY_COUNT_HEADER']:
+        response.headers['X-SQL-Queries'] = str(count)
+    if budget is not None and count > budget:
+        message = f"{request.endpoint} ran {count} SQL statements (budget {budget})"
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def init_app(app):
+    from app import socketio
+    app.before_request(_reset_counter)
+    # after_request handlers run in reverse: the budget check raises last
+    app.after_request(_check_budget)
+    app.after_request(_record_request)
+    app.jinja_env.template_class = TimedTemplate
+    instrument_emits(socketio)
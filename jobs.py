@@ -0,0 +1,231 @@
+"""Durable background jobs for side effects that should not slow requests down.
+
+``enqueue()`` adds a ``Job`` row to the caller's transaction, so a job
+exists exactly when the change that caused it was committed; nothing runs
+for rolled-back work. What happens after the commit depends on
+``JOBS_MODE``:
+
+* ``inline`` runs the new jobs straight away in the same process (tests, CLI);
+* ``background`` hands them to a background task so the request returns first;
+* ``worker`` leaves them to ``flask worker`` processes.
+
+Workers also pick up anything the other modes left behind (e.g. the process
+exited first) and retry failed jobs with exponential backoff. Claiming a
+job is a conditional UPDATE, so any number of workers can share the table.
+Workers emit Socket.IO events through ``SOCKETIO_MESSAGE_QUEUE``; without
+one only the ``inline``/``background`` modes reach connected clients.
+"""
+import json
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import delete, event, inspect, select, update
+
+from app import db, socketio
+from models import Job
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+ERROR_MAX_LENGTH = 4000
+
+# Job name -> handler, filled by @job
+handlers = {}
+
+
+def job(name, max_attempts=None):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def decorator(func):
+        handlers[name] = func
+        func.max_attempts = max_attempts
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, **payload):
+    """Queue ``name(**payload)`` to run once the current transaction commits.
+
+    The payload must be JSON serialisable; pass ids rather than instances.
+    """
+    if name not in handlers:
+        raise KeyError(f'Unknown job {name!r}')
+    row = Job(name=name, payload=json.dumps(payload, sort_keys=True),
+              max_attempts=handlers[name].max_attempts or current_app.config['JOBS_MAX_ATTEMPTS'],
+              run_at=datetime.utcnow() + timedelta(seconds=delay))
+    db.session.add(row)
+    if not delay:
+        db.session.info.setdefault('jobs_enqueued', []).append(row)
+    return row
+
+
+# Dispatch after commit
+
+@event.listens_for(db.session, 'after_commit')
+def _dispatch(session):
+    rows = session.info.pop('jobs_enqueued', None)
+    if not rows:
+        return
+    # The session cannot run SQL here; the identity key is already known.
+    ids = [inspect(row).identity[0] for row in rows if inspect(row).identity]
+    app = current_app._get_current_object()
+    mode = app.config['JOBS_MODE']
+    if mode == 'inline':
+        run_jobs(app, ids)
+    elif mode == 'background':
+        socketio.start_background_task(run_jobs, app, ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+# Running
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    config = current_app.config
+    delay = min(config['JOBS_RETRY_MAX'], config['JOBS_RETRY_BASE'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _claim(job_id):
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == STATUS_QUEUED, Job.run_at <= now)
+        .values(status=STATUS_RUNNING, locked_by=worker_id(), locked_at=now, attempts=Job.attempts + 1)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def run_job(job_id):
+    """Claim and run one job; return True/False for success/failure, None if not claimed."""
+    if not _claim(job_id):
+        return None
+    row = db.session.get(Job, job_id)
+    try:
+        handler = handlers.get(row.name)
+        if handler is None:
+            raise LookupError(f'No handler registered for job {row.name!r}')
+        handler(**json.loads(row.payload))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        current_app.logger.warning('Job %s (%s) failed: %s', job_id, row.name, error.strip().splitlines()[-1])
+        row = db.session.get(Job, job_id)
+        row.last_error = error[-ERROR_MAX_LENGTH:]
+        row.locked_by = row.locked_at = None
+        if row.attempts >= row.max_attempts:
+            row.status = STATUS_FAILED
+            row.finished_at = datetime.utcnow()
+        else:
+            row.status = STATUS_QUEUED
+            row.run_at = datetime.utcnow() + timedelta(seconds=backoff(row.attempts))
+        db.session.commit()
+        return False
+    row.status = STATUS_DONE
+    row.finished_at = datetime.utcnow()
+    row.locked_by = row.locked_at = None
+    db.session.commit()
+    return True
+
+
+def run_jobs(app, ids):
+    # A fresh app context gets its own session, separate from the committing one.
+    with app.app_context():
+        for job_id in ids:
+            run_job(job_id)
+
+
+def release_stale():
+    """Requeue jobs whose worker stopped mid-run (locked longer than JOBS_LOCK_TIMEOUT)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_LOCK_TIMEOUT'])
+    stale = (Job.status == STATUS_RUNNING, Job.locked_at < cutoff)
+    db.session.execute(update(Job).where(*stale, Job.attempts >= Job.max_attempts)
+                       .values(status=STATUS_FAILED, locked_by=None, finished_at=datetime.utcnow()))
+    result = db.session.execute(update(Job).where(*stale).values(status=STATUS_QUEUED, locked_by=None))
+    db.session.commit()
+    return result.rowcount
+
+
+def due_jobs(limit):
+    ids = db.session.scalars(
+        select(Job.id).where(Job.status == STATUS_QUEUED, Job.run_at <= datetime.utcnow())
+        .order_by(Job.run_at, Job.id).limit(limit)
+    ).all()
+    db.session.commit()
+    return ids
+
+
+def work(burst=False):
+    """Run due jobs until stopped (or, with ``burst``, until none are due)."""
+    config = current_app.config
+    processed = 0
+    last_release = 0
+    while True:
+        if time.monotonic() - last_release >= config['JOBS_LOCK_TIMEOUT'] / 2:
+            release_stale()
+            last_release = time.monotonic()
+        ids = due_jobs(config['JOBS_BATCH_SIZE'])
+        for job_id in ids:
+            if run_job(job_id) is not None:
+                processed += 1
+        if not ids:
+            if burst:
+                return processed
+            time.sleep(config['JOBS_POLL_INTERVAL'])
+
+
+def prune(before):
+    """Delete finished jobs older than ``before``; failed ones are kept for inspection."""
+    result = db.session.execute(delete(Job).where(Job.status == STATUS_DONE, Job.finished_at < before))
+    db.session.commit()
+    return result.rowcount
+
+
+def retry_failed():
+    result = db.session.execute(update(Job).where(Job.status == STATUS_FAILED).values(
+        status=STATUS_QUEUED, attempts=0, run_at=datetime.utcnow(), finished_at=None))
+    db.session.commit()
+    return result.rowcount
+
+
+@click.command('worker')
+@click.option('--burst', is_flag=True, help='Exit once no jobs are due.')
+@with_appcontext
+def worker_command(burst):
+    """Run queued background jobs."""
+    click.echo(f"Worker {worker_id()} started.")
+    processed = work(burst=burst)
+    click.echo(f"Processed {processed} jobs.")
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue maintenance.')
+
+
+@jobs_cli.command('prune')
+@click.option('--days', default=7, show_default=True, help='Keep finished jobs from the last N days.')
+def prune_command(days):
+    """Remove finished jobs."""
+    removed = prune(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Removed {removed} finished jobs.")
+
+
+@jobs_cli.command('retry')
+def retry_command():
+    """Queue every failed job again."""
+    click.echo(f"Requeued {retry_failed()} failed jobs.")
@@ -0,0 +1,117 @@
+from flask import current_app, url_for
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+
+from models import ArchivedTicketReply, Ticket, TicketReply
+from utils import encode_cursor, decode_cursor
+
+# Query-string parameter -> Ticket column
+FILTER_COLUMNS = {
+    'status': Ticket.status,
+    'priority': Ticket.priority,
+    'assignee': Ticket.assigned_to,
+    'author': Ticket.user_id,
+}
+INTEGER_FILTERS = {'assignee', 'author'}
+UNASSIGNED = 'none'
+
+
+def parse_filters(args, user):
+    """Pick the supported filters out of request args.
+
+    Non-admin users are always pinned to their own tickets.
+    """
+    filters = {}
+    for name in FILTER_COLUMNS:
+        value = (args.get(name) or '').strip()
+        if not value:
+            continue
+        if name in INTEGER_FILTERS and value != UNASSIGNED:
+            try:
+                value = int(value)
+            except ValueError:
+                continue
+        filters[name] = value
+    if not user.is_admin():
+        filters['author'] = user.id
+    return filters
+
+
+def parse_limit(args, default_key='TICKETS_PER_PAGE', max_key='TICKETS_MAX_PER_PAGE'):
+    default = current_app.config[default_key]
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, current_app.config[max_key]))
+
+
+def filtered_query(filters):
+    query = Ticket.query
+    for name, value in filters.items():
+        column = FILTER_COLUMNS[name]
+        if value == UNASSIGNED:
+            query = query.filter(column.is_(None))
+        else:
+            query = query.filter(column == value)
+    return query
+
+
+class TicketPage:
+    def __init__(self, tickets, filters, next_cursor=None, cursor=None):
+        self.tickets = tickets
+        self.filters = filters
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def to_dict(self):
+        return {
+            'tickets': [dict(t.to_dict(), url=url_for('routes.ticket_detail', ticket_id=t.id))
+                        for t in self.tickets],
+            'filters': self.filters,
+            'next_cursor': self.next_cursor,
+        }
+
+
+def list_tickets(user, args):
+    """Return one keyset page of tickets, newest first, visible to ``user``.
+
+    Pages are ordered on ``(created_at, id)`` so fetching page N costs the
+    same as page 1 regardless of table size.
+    """
+    filters = parse_filters(args, user)
+    limit = parse_limit(args)
+    cursor = args.get('cursor') or None
+
+    tickets, next_cursor = keyset_page(filtered_query(filters), Ticket.created_at, Ticket.id, cursor, limit)
+    return TicketPage(tickets, filters, next_cursor=next_cursor, cursor=cursor)
+
+
+def keyset_page(query, timestamp_column, id_column, cursor, limit):
+    """Fetch ``limit`` rows newest first after ``cursor``; return (rows, next_cursor)."""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            timestamp_column < timestamp,
+            and_(timestamp_column == timestamp, id_column < row_id),
+        ))
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+
+def list_replies(ticket, args):
+    """One page of a ticket's replies, newest first, with their authors loaded."""
+    model = ArchivedTicketReply if ticket.archived else TicketReply
+    query = model.query.options(joinedload(model.author)).filter(model.ticket_id == ticket.id)
+    limit = parse_limit(args, 'REPLIES_PER_PAGE', 'REPLIES_MAX_PER_PAGE')
+    return keyset_page(query, model.created_at, model.id, args.get('cursor') or None, limit)
+
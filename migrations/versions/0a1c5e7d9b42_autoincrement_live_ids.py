@@ -0,0 +1,46 @@
+"""autoincrement live ids
+
+Revision ID: 0a1c5e7d9b42
+Revises: ef9069658ee3
+Create Date: 2026-10-18 18:05:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a1c5e7d9b42'
+down_revision = 'ef9069658ee3'
+branch_labels = None
+depends_on = None
+
+# Live table -> archive table holding rows that came from it
+TABLES = {
+    'ticket': 'archived_ticket',
+    'ticket_reply': 'archived_ticket_reply',
+    'audit_log': 'archived_audit_log',
+}
+
+
+def upgrade():
+    # Other databases use sequences, which never hand out an id twice.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, archive in TABLES.items():
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+        # Start after every id already used, including archived rows.
+        op.execute(f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', 0 "
+                   f"WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table}')")
+        op.execute(f"UPDATE sqlite_sequence SET seq = max(seq, "
+                   f"(SELECT coalesce(max(id), 0) FROM {table}), "
+                   f"(SELECT coalesce(max(id), 0) FROM {archive})) WHERE name = '{table}'")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
@@ -0,0 +1,41 @@
+"""unique ticket stat groups
+
+Revision ID: 55927927edd2
+Revises: 2f24aec44459
+Create Date: 2026-10-18 17:40:57.299587
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '55927927edd2'
+down_revision = '2f24aec44459'
+branch_labels = None
+depends_on = None
+
+
+GROUP = ('day', "coalesce(status, '')", "coalesce(priority, '')", 'coalesce(assigned_to, 0)')
+
+
+def upgrade():
+    # Fold groups that concurrent first tickets split into several rows
+    op.execute(
+        "UPDATE ticket_stat SET count = (SELECT sum(s.count) FROM ticket_stat s "
+        "WHERE s.day = ticket_stat.day "
+        "AND coalesce(s.status, '') = coalesce(ticket_stat.status, '') "
+        "AND coalesce(s.priority, '') = coalesce(ticket_stat.priority, '') "
+        "AND coalesce(s.assigned_to, 0) = coalesce(ticket_stat.assigned_to, 0))"
+    )
+    op.execute(f"DELETE FROM ticket_stat WHERE id NOT IN "
+               f"(SELECT min(id) FROM ticket_stat GROUP BY {', '.join(GROUP)})")
+    with op.batch_alter_table('ticket_stat', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_stat_group')
+    op.create_index('uq_ticket_stat_group', 'ticket_stat', [sa.text(part) for part in GROUP], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_ticket_stat_group', table_name='ticket_stat')
+    with op.batch_alter_table('ticket_stat', schema=None) as batch_op:
+        batch_op.create_index('ix_ticket_stat_group', ['day', 'status', 'priority', 'assigned_to'], unique=False)
@@ -1,13 +1,19 @@
 from datetime import datetime
 import uuid
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from app import db, login_manager
+from passwords import hash_password, verify_password
 
 # Role constants
 ROLE_USER = 'user'
 ROLE_SUPPORT = 'support'
 ROLE_ADMIN = 'admin'
+ADMIN_ROLES = (ROLE_ADMIN, ROLE_SUPPORT)
+
+# Ticket field values
+TICKET_STATUSES = ('open', 'in progress', 'closed')
+TICKET_PRIORITIES = ('low', 'normal', 'high')
 
 # Association tables for advanced permissions
 user_permissions = db.Table('user_permissions',
@@ -52,6 +58,8 @@ class User(UserMixin, db.Model):
     can_reply_ticket  = db.Column(db.Boolean, default=True)
     can_edit_ticket   = db.Column(db.Boolean, default=False)
     can_delete_ticket = db.Column(db.Boolean, default=False)
+    # Bumped whenever anything feeding the compiled permission set changes
+    perm_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Advanced permissions via roles
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'))
@@ -61,67 +69,42 @@ class User(UserMixin, db.Model):
     permissions = db.relationship('Permission', secondary=user_permissions,
                                   backref=db.backref('users', lazy='dynamic'))
 
-    tickets = db.relationship('Ticket', backref='author', lazy='dynamic')
+    tickets = db.relationship('Ticket', foreign_keys='Ticket.user_id', backref='author', lazy='dynamic')
     messages_sent = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender', lazy='dynamic')
     messages_received = db.relationship('Message', foreign_keys='Message.recipient_id', backref='recipient', lazy='dynamic')
     audit_logs = db.relationship('AuditLog', backref='user', lazy='dynamic')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
     def is_admin(self):
-        return self.role == ROLE_ADMIN or self.role == ROLE_SUPPORT
+        return self.role in ADMIN_ROLES
+
+    def can_access_ticket(self, ticket):
+        return self.is_admin() or ticket.user_id == self.id
 
     def has_permission(self, perm_name):
-        # Check direct permissions
-        if any(p.name == perm_name for p in self.permissions):
-            return True
-        # Check role permissions
-        if self.role_obj and any(p.name == perm_name for p in self.role_obj.permissions):
-            return True
-        # Fallback to legacy flags
-        if perm_name == 'create_ticket' and self.can_create_ticket:
-            return True
-        if perm_name == 'view_ticket' and self.can_view_ticket:
-            return True
-        if perm_name == 'reply_ticket' and self.can_reply_ticket:
-            return True
-        if perm_name == 'edit_ticket' and self.can_edit_ticket:
-            return True
-        if perm_name == 'delete_ticket' and self.can_delete_ticket:
-            return True
-        return False
+        return perm_name in self.effective_permissions()
+
+    def effective_permissions(self):
+        """Frozen set of permission names from role, direct grants and legacy flags."""
+        from permissions import effective_permissions
+        return effective_permissions(self)
 
     def get_effective_permissions(self):
         """Return a list of permissions the user currently has (combining role and direct flags)."""
-        perms = set()
-        # From role permissions:
-        if self.role_obj:
-            perms.update([p.name for p in self.role_obj.permissions])
-        # From direct permissions:
-        perms.update([p.name for p in self.permissions])
-        # Include legacy flags if set:
-        if self.can_create_ticket:
-            perms.add('create_ticket')
-        if self.can_view_ticket:
-            perms.add('view_ticket')
-        if self.can_reply_ticket:
-            perms.add('reply_ticket')
-        if self.can_edit_ticket:
-            perms.add('edit_ticket')
-        if self.can_delete_ticket:
-            perms.add('delete_ticket')
-        return list(perms)
+        return sorted(self.effective_permissions())
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from identity import load_identity
+    return load_identity(int(user_id))
 
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -136,12 +119,87 @@ class Ticket(db.Model):
 
     replies = db.relationship('TicketReply', backref='ticket', lazy='dynamic')
 
+    archived = False
+
+    # Indexes follow the listing/count query shapes: equality filter first,
+    # then the (created_at, id) keyset ordering.
+    __table_args__ = (
+        db.Index('ix_ticket_created_at_id', 'created_at', 'id'),
+        db.Index('ix_ticket_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_ticket_status_created', 'status', 'created_at', 'id'),
+        db.Index('ix_ticket_priority_created', 'priority', 'created_at', 'id'),
+        db.Index('ix_ticket_assigned_created', 'assigned_to', 'created_at', 'id'),
+        # AUTOINCREMENT: SQLite would otherwise reuse the ids of rows moved to the
+        # archive (archive.py), for this table, ticket_reply and audit_log alike
+        {'sqlite_autoincrement': True},
+    )
+
     def ticket_number(self):
         return f"Ticket# {self.created_at.strftime('%m-%y')}-{self.id:03d}"
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'number': self.ticket_number(),
+            'subject': self.subject,
+            'status': self.status,
+            'priority': self.priority,
+            'user_id': self.user_id,
+            'assigned_to': self.assigned_to,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
     def __repr__(self):
         return f'<Ticket {self.ticket_number()}>'
 
+class TicketStat(db.Model):
+    """Ticket counts per creation day, status, priority and assignee.
+
+    Maintained incrementally by the hooks in analytics.py; rebuild with
+    ``flask analytics rebuild``.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    status = db.Column(db.String(20))
+    priority = db.Column(db.String(20))
+    assigned_to = db.Column(db.Integer)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # One row per group: NULLs never collide in a unique index, so the key
+        # coalesces them; analytics.adjust upserts against these expressions
+        db.Index('uq_ticket_stat_group', day, db.func.coalesce(status, db.literal_column("''")),
+                 db.func.coalesce(priority, db.literal_column("''")),
+                 db.func.coalesce(assigned_to, db.literal_column('0')), unique=True),
+    )
+
+    def __repr__(self):
+        return f'<TicketStat {self.day} {self.status} {self.count}>'
+
+class TicketChange(db.Model):
+    """Append-only log of ticket list changes; ``id`` doubles as the list version.
+
+    Ids come from ``TicketChangeCounter`` in commit order, not from the database.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    ticket_id = db.Column(db.Integer, nullable=False)
+    owner_id = db.Column(db.Integer)
+    action = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_ticket_change_owner_id', 'owner_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<TicketChange {self.id} {self.action} ticket {self.ticket_id}>'
+
+class TicketChangeCounter(db.Model):
+    """Single row holding the last ``TicketChange`` id handed out (see changelog.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
 class TicketReply(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.Text, nullable=False)
@@ -150,9 +208,70 @@ class TicketReply(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     attachment = db.Column(db.String(200))
 
+    author = db.relationship('User', foreign_keys=[user_id])
+
+    __table_args__ = (
+        db.Index('ix_ticket_reply_ticket_created', 'ticket_id', 'created_at'),
+        db.Index('ix_ticket_reply_attachment', 'attachment'),
+        {'sqlite_autoincrement': True},
+    )
+
     def __repr__(self):
         return f'<TicketReply {self.id}>'
 
+class ArchivedTicket(db.Model):
+    """A closed ticket moved out of the live table by ``flask tickets archive``.
+
+    Keeps the ticket's id, so links keep working; see archive.py.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    subject = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20))
+    priority = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    archived = True
+    ticket_number = Ticket.ticket_number
+    to_dict = Ticket.to_dict
+
+    def __repr__(self):
+        return f'<ArchivedTicket {self.ticket_number()}>'
+
+class ArchivedTicketReply(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('archived_ticket.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    attachment = db.Column(db.String(200))
+
+    author = db.relationship('User', foreign_keys=[user_id])
+
+    __table_args__ = (
+        db.Index('ix_archived_ticket_reply_ticket_created', 'ticket_id', 'created_at'),
+        db.Index('ix_archived_ticket_reply_attachment', 'attachment'),
+    )
+
+    def __repr__(self):
+        return f'<ArchivedTicketReply {self.id}>'
+
+class Blob(db.Model):
+    """A content-addressed attachment file and how many rows reference it."""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, index=True, nullable=False)
+    size = db.Column(db.BigInteger)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime)  # last time a reference was dropped
+
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs={self.ref_count}>'
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text, nullable=False)
@@ -161,14 +280,119 @@ class Message(db.Model):
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     attachment = db.Column(db.String(200))
 
+    __table_args__ = (
+        db.Index('ix_message_pair_timestamp', 'sender_id', 'recipient_id', 'timestamp'),
+        db.Index('ix_message_recipient_timestamp', 'recipient_id', 'timestamp'),
+        db.Index('ix_message_attachment', 'attachment'),
+    )
+
     def __repr__(self):
         return f'<Message {self.id}>'
 
+class Conversation(db.Model):
+    """One user's side of a private-message thread with a peer.
+
+    Kept current by the Message hooks in conversations.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    peer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer)
+    last_message_at = db.Column(db.DateTime)
+    last_preview = db.Column(db.String(100))
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
+    peer = db.relationship('User', foreign_keys=[peer_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'peer_id', name='uq_conversation_user_peer'),
+        db.Index('ix_conversation_user_last', 'user_id', 'last_message_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Conversation {self.user_id}->{self.peer_id}>'
+
+class SearchDocument(db.Model):
+    """Searchable text for one ticket, reply or message plus who may see it.
+
+    The text index itself (FTS5 on SQLite, ``tsv`` on PostgreSQL) is
+    maintained by search.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    ref_id = db.Column(db.Integer, nullable=False)
+    ticket_id = db.Column(db.Integer)
+    owner_id = db.Column(db.Integer)
+    peer_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    body = db.Column(db.Text, nullable=False)
+    tsv = db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql'))
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'ref_id', name='uq_search_document_ref'),
+        db.Index('ix_search_document_ticket', 'ticket_id'),
+        db.Index('ix_search_document_owner', 'owner_id'),
+        db.Index('ix_search_document_peer', 'peer_id'),
+    )
+
+    def __repr__(self):
+        return f'<SearchDocument {self.kind}:{self.ref_id}>'
+
+class Job(db.Model):
+    """Durable background job; rows are written in the transaction that enqueues them."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
 class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     action = db.Column(db.String(200))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    target_type = db.Column(db.String(20))
+    target_id = db.Column(db.Integer)
+    details = db.Column(db.Text)
+    ip_address = db.Column(db.String(45))
+
+    __table_args__ = (
+        db.Index('ix_audit_log_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_audit_log_action_timestamp', 'action', 'timestamp'),
+        {'sqlite_autoincrement': True},
+    )
 
     def __repr__(self):
         return f'<AuditLog {self.action} by User {self.user_id}>'
+
+class ArchivedAuditLog(db.Model):
+    """Audit entries about archived tickets, moved along with them."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    action = db.Column(db.String(200))
+    timestamp = db.Column(db.DateTime)
+    target_type = db.Column(db.String(20))
+    target_id = db.Column(db.Integer)
+    details = db.Column(db.Text)
+    ip_address = db.Column(db.String(45))
+
+    __table_args__ = (
+        db.Index('ix_archived_audit_log_target', 'target_type', 'target_id'),
+    )
+
+    def __repr__(self):
+        return f'<ArchivedAuditLog {self.action} by User {self.user_id}>'
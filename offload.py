@@ -0,0 +1,79 @@
+"""Blocking work kept off the eventlet hub.
+
+An ``OffloadPool`` runs at most ``size`` calls at once. Calls made from an
+eventlet green thread go to eventlet's ``tpool`` of real OS threads, so a
+slow hash, image resize or subprocess does not freeze every other request
+and Socket.IO connection in the worker; calls from plain OS threads (CLI,
+``flask worker``, tests) run in place. The pool counts waiting and running
+calls for the ``/metrics`` gauges of its users.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+def in_green_thread():
+    """True inside an eventlet green thread, where blocking would stall the hub."""
+    from app import socketio
+    if getattr(socketio, 'async_mode', None) != 'eventlet':
+        return False
+    import greenlet
+    # Plain OS threads (CLI, workers, tests) run in their root greenlet
+    return greenlet.getcurrent().parent is not None
+
+
+class OffloadPool:
+    """Runs blocking calls ``size`` at a time, on OS threads."""
+
+    def __init__(self, size=4, wait=None):
+        self.size = size
+        # Optional histogram observing the time spent queued for a slot
+        self.wait = wait
+        self.waiting = self.running = 0
+        self._lock = threading.Lock()
+        # One semaphore per kind of caller: green threads must not block on OS locks
+        self._slots = {}
+
+    def configure(self, size):
+        if size != self.size:
+            self.size = size
+            self._slots = {}
+
+    def _count(self, waiting=0, running=0):
+        with self._lock:
+            self.waiting += waiting
+            self.running += running
+
+    @contextmanager
+    def _slot(self, green):
+        """Wait for a free slot; ``green`` waits without blocking the eventlet hub."""
+        slots = self._slots.get(green)
+        if slots is None:
+            if green:
+                from eventlet.semaphore import Semaphore
+            else:
+                from threading import BoundedSemaphore as Semaphore
+            slots = self._slots.setdefault(green, Semaphore(self.size))
+        started = time.perf_counter()
+        self._count(waiting=1)
+        slots.acquire()
+        self._count(waiting=-1, running=1)
+        if self.wait is not None:
+            self.wait.observe(time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            self._count(running=-1)
+            slots.release()
+
+    def run(self, func, *args):
+        green = in_green_thread()
+        with self._slot(green):
+            if green:
+                from eventlet import tpool
+                return tpool.execute(func, *args)
+            return func(*args)
+
+    def samples(self):
+        yield {'state': 'waiting'}, self.waiting
+        yield {'state': 'running'}, self.running
@@ -0,0 +1,53 @@
+"""Password hashing off the event loop.
+
+pbkdf2 is deliberately slow; under eventlet a hash computed on the hub
+thread stalls every Socket.IO connection of the worker until it finishes.
+``hash_password``/``verify_password`` run through an ``OffloadPool``
+(offload.py): from a green thread the work goes to eventlet's ``tpool`` of
+real OS threads, and hashlib releases the GIL while hashing, so the hub
+keeps serving. At most ``PASSWORD_HASH_WORKERS`` hashes run at once and the
+rest queue for a slot, so a login burst cannot starve the CPU; the queue
+depth and wait/hash times are exported through ``/metrics``.
+``PASSWORD_HASH_POOL = 'inline'`` skips the pool entirely.
+
+``PASSWORD_HASH_METHOD`` sets the algorithm and cost of new hashes;
+existing hashes keep verifying with the cost they were created with.
+"""
+import time
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from instrumentation import LATENCY_BUCKETS, registry
+from offload import OffloadPool
+
+HASH_WAIT = registry.histogram('password_hash_wait_seconds',
+                               'Time spent queued for a password hashing slot.', (), LATENCY_BUCKETS)
+HASH_TIME = registry.histogram('password_hash_seconds',
+                               'Time spent hashing or verifying a password.', ('operation',), LATENCY_BUCKETS)
+
+hash_pool = OffloadPool(wait=HASH_WAIT)
+registry.gauge('password_hash_queue', 'Password hashing calls by state.', hash_pool.samples)
+
+
+def _run(operation, func, *args):
+    started = time.perf_counter()
+    try:
+        if has_app_context() and current_app.config['PASSWORD_HASH_POOL'] != 'inline':
+            return hash_pool.run(func, *args)
+        return func(*args)
+    finally:
+        HASH_TIME.observe(time.perf_counter() - started, operation=operation)
+
+
+def hash_password(password):
+    method = current_app.config['PASSWORD_HASH_METHOD'] if has_app_context() else 'pbkdf2:sha256'
+    return _run('hash', generate_password_hash, password, method)
+
+
+def verify_password(password_hash, password):
+    return _run('verify', check_password_hash, password_hash, password)
+
+
+def init_app(app):
+    hash_pool.configure(app.config['PASSWORD_HASH_WORKERS'])
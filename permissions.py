@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect, select, union, update
+
+from app import db
+from models import User, Role, Permission, user_permissions, role_permissions
+
+# Legacy boolean columns and the permission each one grants
+LEGACY_FLAGS = {
+    'can_create_ticket': 'create_ticket',
+    'can_view_ticket': 'view_ticket',
+    'can_reply_ticket': 'reply_ticket',
+    'can_edit_ticket': 'edit_ticket',
+    'can_delete_ticket': 'delete_ticket',
+}
+# User attributes whose change alters the compiled permission set
+USER_PERMISSION_ATTRS = tuple(LEGACY_FLAGS) + ('role', 'role_id', 'role_obj', 'permissions')
+
+
+class PermissionCache:
+    """Bounded LRU of compiled permission sets keyed on (user id, perm_version)."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, version, permissions):
+        with self._lock:
+            self._entries[user_id] = (version, permissions)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+permission_cache = PermissionCache()
+
+
+def granted_permission_names(user_id):
+    """Direct and role permission names for ``user_id`` in one query."""
+    direct = select(Permission.name) \
+        .join(user_permissions, user_permissions.c.permission_id == Permission.id) \
+        .where(user_permissions.c.user_id == user_id)
+    via_role = select(Permission.name) \
+        .join(role_permissions, role_permissions.c.permission_id == Permission.id) \
+        .join(User, User.role_id == role_permissions.c.role_id) \
+        .where(User.id == user_id)
+    return set(db.session.execute(union(direct, via_role)).scalars())
+
+
+def compile_permissions(user):
+    names = granted_permission_names(user.id)
+    names.update(perm for flag, perm in LEGACY_FLAGS.items() if getattr(user, flag))
+    return frozenset(names)
+
+
+def effective_permissions(user):
+    """Return the user's permission set, compiling it at most once per version."""
+    version = user.perm_version or 0
+    permissions = permission_cache.get(user.id, version)
+    if permissions is None:
+        permissions = compile_permissions(user)
+        permission_cache.put(user.id, version, permissions)
+    return permissions
+
+
+@event.listens_for(User, 'before_update')
+def _bump_user_version(mapper, connection, user):
+    state = inspect(user)
+    if any(state.attrs[attr].history.has_changes() for attr in USER_PERMISSION_ATTRS):
+        user.perm_version = (user.perm_version or 0) + 1
+        permission_cache.discard(user.id)
+
+
+@event.listens_for(User, 'after_delete')
+def _forget_user(mapper, connection, user):
+    permission_cache.discard(user.id)
+
+
+def _bump_role_members(connection, role):
+    connection.execute(
+        update(User).where(User.role_id == role.id).values(perm_version=User.perm_version + 1)
+    )
+    permission_cache.clear()
+
+
+@event.listens_for(Role, 'after_update')
+def _role_updated(mapper, connection, role):
+    if inspect(role).attrs.permissions.history.has_changes():
+        _bump_role_members(connection, role)
+
+
+@event.listens_for(Role, 'after_delete')
+def _role_deleted(mapper, connection, role):
+    _bump_role_members(connection, role)
+
+
+@event.listens_for(Permission, 'after_update')
+@event.listens_for(Permission, 'after_delete')
+def _bump_everyone(mapper, connection, permission):
+    connection.execute(update(User).values(perm_version=User.perm_version + 1))
+    permission_cache.clear()
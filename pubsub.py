@@ -0,0 +1,175 @@
+"""Socket.IO client managers for sharing emits between worker processes.
+
+Redis, Kafka, ZeroMQ and Kombu URLs are handled by Flask-SocketIO itself.
+This module adds two stand-ins for tests and single-box deployments:
+
+* ``sqlite:///path/to/queue.db`` -- a table in a local SQLite file polled by
+  every worker; works across processes on one machine without extra services.
+* ``memory://`` -- an in-process bus; lets several Socket.IO servers in one
+  process (e.g. in tests) exchange messages.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+import socketio
+
+SQLITE_PREFIX = 'sqlite:///'
+MEMORY_PREFIX = 'memory://'
+
+
+class SQLiteManager(socketio.PubSubManager):
+    name = 'sqlite'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=0.05, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url[len(SQLITE_PREFIX):]
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS socketio_message ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+            'payload TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _sleep(self, seconds):
+        if self.server is not None:
+            self.server.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _publish(self, data):
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO socketio_message (channel, payload, created_at) VALUES (?, ?, ?)',
+                (self.channel, json.dumps(data), time.time()),
+            )
+
+    def _listen(self):
+        connection = self._connect()
+        last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_message').fetchone()[0]
+        last_prune = time.time()
+        while True:
+            rows = connection.execute(
+                'SELECT id, payload FROM socketio_message WHERE id > ? AND channel = ? ORDER BY id',
+                (last_id, self.channel),
+            ).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield payload
+            if time.time() - last_prune > self.retention:
+                connection.execute('DELETE FROM socketio_message WHERE created_at < ?',
+                                   (time.time() - self.retention,))
+                last_prune = time.time()
+            if not rows:
+                self._sleep(self.poll_interval)
+
+
+class MemoryManager(socketio.PubSubManager):
+    """In-process bus: every live manager on a channel gets every message.
+
+    The subscriber registry is shared by all instances in the process;
+    ``close()`` takes a manager off it and stops its listener.
+    """
+    name = 'memory'
+    _subscribers = {}
+    _subscribers_lock = threading.Lock()
+
+    def __init__(self, url=MEMORY_PREFIX, channel='flask-socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.queue = None
+
+    def initialize(self):
+        if not self.write_only:
+            self.queue = self.server.eio.create_queue()
+            with self._subscribers_lock:
+                self._subscribers.setdefault(self.channel, []).append(self.queue)
+        super().initialize()
+
+    def close(self):
+        if self.queue is None:
+            return
+        with self._subscribers_lock:
+            queues = self._subscribers.get(self.channel, [])
+            if self.queue in queues:
+                queues.remove(self.queue)
+            if not queues:
+                self._subscribers.pop(self.channel, None)
+        self.queue.put(None)
+        self.queue = None
+
+    def _publish(self, data):
+        payload = json.dumps(data)
+        with self._subscribers_lock:
+            queues = list(self._subscribers.get(self.channel, []))
+        for queue in queues:
+            queue.put(payload)
+
+    def _listen(self):
+        queue = self.queue
+        while True:
+            payload = queue.get()
+            if payload is None:
+                return
+            yield payload
+
+    def _thread(self):
+        # PubSubManager._thread reports the end of _listen() as an error;
+        # here it only ends when close() was called.
+        handlers = {'emit': self._handle_emit, 'disconnect': self._handle_disconnect,
+                    'enter_room': self._handle_enter_room, 'leave_room': self._handle_leave_room,
+                    'close_room': self._handle_close_room}
+        for payload in self._listen():
+            data = json.loads(payload)
+            try:
+                if data['method'] == 'callback':
+                    self._handle_callback(data)
+                elif data.get('host_id') != self.host_id and data['method'] in handlers:
+                    handlers[data['method']](data)
+            except Exception:
+                self.server.logger.exception('Handler error in pubsub listening thread')
+
+
+def client_manager_class(url):
+    """Return the client manager class Flask-SocketIO would use for ``url``."""
+    if url.startswith(SQLITE_PREFIX):
+        return SQLiteManager
+    if url.startswith(MEMORY_PREFIX):
+        return MemoryManager
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager
+    if url.startswith('kafka://'):
+        return socketio.KafkaManager
+    if url.startswith('zmq'):
+        return socketio.ZmqManager
+    return socketio.KombuManager
+
+
+def socketio_options(config):
+    """Return the ``socketio.init_app`` keyword arguments for ``config``."""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if not url:
+        return {}
+    manager_class = client_manager_class(url)
+    if manager_class in (SQLiteManager, MemoryManager):
+        return {'client_manager': manager_class(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+
+def release(server):
+    """Take a Socket.IO server that is being replaced off the in-process bus."""
+    manager = getattr(server, 'manager', None)
+    if isinstance(manager, MemoryManager):
+        manager.close()
@@ -0,0 +1,179 @@
+from flask import has_request_context, url_for
+from flask_login import current_user
+from flask_socketio import join_room, leave_room
+
+from app import db, socketio
+from jobs import job
+from models import Message, Ticket, TicketReply
+
+AGENTS_ROOM = 'agents'
+
+
+def user_room(user_id):
+    return f'user:{user_id}'
+
+
+def ticket_room(ticket_id):
+    return f'ticket:{ticket_id}'
+
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    if not current_user.is_authenticated:
+        return False
+    join_room(user_room(current_user.id))
+    if current_user.is_admin():
+        join_room(AGENTS_ROOM)
+
+
+def _ticket_from(data):
+    try:
+        ticket_id = int((data or {}).get('ticket_id'))
+    except (TypeError, ValueError):
+        return None
+    return db.session.get(Ticket, ticket_id)
+
+
+@socketio.on('join_ticket')
+def handle_join_ticket(data):
+    if not current_user.is_authenticated:
+        return
+    ticket = _ticket_from(data)
+    if ticket is not None and current_user.can_access_ticket(ticket):
+        join_room(ticket_room(ticket.id))
+
+
+@socketio.on('leave_ticket')
+def handle_leave_ticket(data):
+    ticket = _ticket_from(data)
+    if ticket is not None:
+        leave_room(ticket_room(ticket.id))
+
+
+def ticket_rooms(ticket):
+    """Everyone who may see ``ticket`` (see ``can_access_ticket``): its author, viewers and agents.
+
+    Assignees are reached through ``agents``; a non-agent assignee cannot
+    open the ticket, so it is not pushed to them either.
+    """
+    return [AGENTS_ROOM, user_room(ticket.user_id), ticket_room(ticket.id)]
+
+
+def ticket_payload(action, ticket, **extra):
+    summary = ticket.to_dict()
+    if has_request_context():
+        summary['url'] = url_for('routes.ticket_detail', ticket_id=ticket.id)
+    return dict({'action': action, 'ticket_id': ticket.id, 'status': ticket.status, 'ticket': summary}, **extra)
+
+
+def emit_ticket_event(action, ticket, **extra):
+    socketio.emit('ticket_event', ticket_payload(action, ticket, **extra), to=ticket_rooms(ticket))
+
+
+@job('realtime.ticket_event')
+def ticket_event_job(action, ticket_id, reply_id=None):
+    ticket = db.session.get(Ticket, ticket_id)
+    if ticket is None:
+        return
+    extra = {}
+    reply = db.session.get(TicketReply, reply_id) if reply_id else None
+    if reply is not None:
+        extra['reply'] = {
+            'id': reply.id,
+            'user_id': reply.user_id,
+            'preview': reply.message[:50],
+            'created_at': reply.created_at.isoformat(),
+        }
+    emit_ticket_event(action, ticket, **extra)
+
+
+def emit_ticket_diffs(changes):
+    """Push committed list changes: agents get all of them, authors their own."""
+    by_room = {AGENTS_ROOM: []}
+    for change in changes:
+        by_room[AGENTS_ROOM].append(change)
+        if change['owner_id'] is not None:
+            by_room.setdefault(user_room(change['owner_id']), []).append(change)
+    for room, room_changes in by_room.items():
+        if room_changes:
+            socketio.emit('ticket_diff', {
+                'version': max(change['version'] for change in room_changes),
+                'changes': [{key: value for key, value in change.items() if key != 'owner_id'}
+                            for change in room_changes],
+            }, to=room)
+
+
+@job('realtime.ticket_diffs')
+def ticket_diffs_job(changes):
+    emit_ticket_diffs(changes)
+
+
+@job('realtime.ticket_changes')
+def ticket_changes_job(version, action, rows=None, owner_ids=None):
+    """Push a set-based change (bulk update, archive, restore) logged at ``version``.
+
+    Gets ``rows`` of ``[ticket_id, owner_id]``, or just ``owner_ids`` when
+    the change is too big to send row by row and lists should reload.
+    """
+    if rows is None:
+        emit_ticket_resync(version, owner_ids)
+        return
+    from changelog import ACTION_REMOVE, ticket_row
+    tickets = {}
+    if action != ACTION_REMOVE:
+        tickets = {ticket.id: ticket_row(ticket)
+                   for ticket in Ticket.query.filter(Ticket.id.in_([ticket_id for ticket_id, _ in rows]))}
+    emit_ticket_diffs([{
+        'version': version, 'action': action, 'id': ticket_id, 'owner_id': owner_id,
+        'ticket': tickets.get(ticket_id),
+    } for ticket_id, owner_id in rows if action == ACTION_REMOVE or ticket_id in tickets])
+
+
+def emit_ticket_resync(version, owner_ids):
+    """Tell list viewers to reload: the change at ``version`` is too big to send as rows."""
+    payload = {'version': version, 'changes': [], 'resync': True}
+    for room in [AGENTS_ROOM] + [user_room(owner_id) for owner_id in sorted(owner_ids)]:
+        socketio.emit('ticket_diff', payload, to=room)
+
+
+def emit_bulk_progress(user_id, operation, done, total, updated):
+    socketio.emit('bulk_progress', {
+        'operation': operation, 'done': done, 'total': total, 'updated': updated,
+    }, to=user_room(user_id))
+
+
+@socketio.on('ticket_resync')
+def handle_ticket_resync(data):
+    """Reconnect handshake: return what changed since the client's version."""
+    if not current_user.is_authenticated or not isinstance(data, dict):
+        return {'resync': True}
+    from changelog import changes_since, current_version
+    from listing import parse_filters
+    try:
+        since = int(data.get('since'))
+    except (TypeError, ValueError):
+        return {'resync': True}
+    filters = data.get('filters') or {}
+    if not isinstance(filters, dict):
+        return {'resync': True}
+    filters = {name: value for name, value in filters.items() if isinstance(value, str)}
+    delta = changes_since(current_user, since, parse_filters(filters, current_user))
+    return delta or {'resync': True, 'version': current_version(current_user)}
+
+
+def emit_private_message(message, sender):
+    socketio.emit('private_message', {
+        'message_id': message.id,
+        'sender': sender.username,
+        'sender_id': sender.id,
+        'recipient_id': message.recipient_id,
+        'preview': message.body[:50],
+        'timestamp': message.timestamp.isoformat(),
+    }, to=user_room(message.recipient_id))
+
+
+@job('realtime.private_message')
+def private_message_job(message_id):
+    message = db.session.get(Message, message_id)
+    if message is not None:
+        emit_private_message(message, message.sender)
@@ -1,18 +1,84 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, send_from_directory
+import hashlib
+import hmac
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, abort, make_response
 from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.urls import url_parse
 
-from app import db, socketio
-from models import User, Ticket, TicketReply, Message
+from app import db, limiter
+from models import User, Ticket, TicketReply, Message, TICKET_STATUSES, TICKET_PRIORITIES
 from forms import LoginForm, RegistrationForm, ProfileForm, TicketForm, TicketReplyForm, PrivateMessageForm
-from utils import save_file
+from utils import allowed_file, form_attachment
+from storage import UploadError, start_upload, upload_status, append_chunk
+from listing import list_tickets, list_replies, parse_filters
+from instrumentation import query_budget, registry
+from database import read_only
+from audit import audit
+from changelog import current_version, changes_since
+from fragments import fragment_cache
+from attachments import can_access_attachment, send_attachment
+from thumbnails import has_thumbnail, send_thumbnail
+from archive import find_ticket
+from jobs import enqueue
+from conversations import (list_conversations, conversation_history, mark_read, search_users,
+                           message_to_dict, conversation_to_dict)
+from search import search
 
 main = Blueprint('routes', __name__)
 
+@main.app_context_processor
+def inject_ticket_choices():
+    return {'ticket_statuses': TICKET_STATUSES, 'ticket_priorities': TICKET_PRIORITIES,
+            'has_thumbnail': has_thumbnail}
+
 @main.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    if not can_access_attachment(current_user, filename):
+        abort(404)
+    return send_attachment(filename)
+
+@main.route('/uploads/<filename>/thumbnail')
+@login_required
+def attachment_thumbnail(filename):
+    if not has_thumbnail(filename) or not can_access_attachment(current_user, filename):
+        abort(404)
+    return send_thumbnail(filename)
+
+@main.route('/uploads/sessions', methods=['POST'])
+@login_required
+def upload_start():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    filename = data.get('filename')
+    if not isinstance(filename, str) or not allowed_file(filename):
+        return jsonify({'error': 'File type is not allowed.'}), 400
+    size = data.get('size')
+    if isinstance(size, str) and size.isdigit():
+        size = int(size)
+    if not isinstance(size, int) or isinstance(size, bool):
+        return jsonify({'error': 'Upload size must be a whole number of bytes.'}), 400
+    try:
+        return jsonify(start_upload(current_user.id, filename, size)), 201
+    except (UploadError, ValueError) as exc:
+        return jsonify({'error': str(exc)}), 400
+
+@main.route('/uploads/sessions/<upload_id>', methods=['GET', 'PUT'])
+@login_required
+def upload_chunk(upload_id):
+    try:
+        if request.method == 'GET':
+            return jsonify(upload_status(upload_id, current_user.id))
+        # Content-Range: bytes <start>-<end>/<total>
+        content_range = request.headers.get('Content-Range', '')
+        try:
+            start = int(content_range.split(' ', 1)[1].split('-', 1)[0])
+        except (IndexError, ValueError):
+            return jsonify({'error': 'Content-Range header required.'}), 400
+        return jsonify(append_chunk(upload_id, current_user.id, start, request.stream))
+    except UploadError as exc:
+        return jsonify({'error': str(exc)}), 409
 
 @main.route('/')
 def index():
@@ -20,15 +86,22 @@ def index():
         return redirect(url_for('routes.dashboard'))
     return redirect(url_for('routes.login'))
 
+def _login_username():
+    return 'login:' + (request.form.get('username') or '').strip().lower()
+
 @main.route('/login', methods=['GET','POST'])
+@limiter.limit(lambda: current_app.config['LOGIN_RATE_LIMIT'], methods=['POST'])
+@limiter.limit(lambda: current_app.config['LOGIN_USERNAME_RATE_LIMIT'], methods=['POST'], key_func=_login_username)
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user is None or not user.check_password(form.password.data):
+            audit('login.failed', user_id=user.id if user else None, details={'username': form.username.data})
             flash('Invalid username or password')
             return redirect(url_for('routes.login'))
         login_user(user)
+        audit('login', user_id=user.id)
         next_page = request.args.get('next')
         if not next_page or url_parse(next_page).netloc != '':
             next_page = url_for('routes.dashboard')
@@ -58,12 +131,13 @@ def register():
 @main.route('/profile', methods=['GET','POST'])
 @login_required
 def profile():
-    form = ProfileForm(obj=current_user)
+    user = current_user.load()
+    form = ProfileForm(obj=user)
     if form.validate_on_submit():
-        current_user.email = form.email.data
-        current_user.full_name = form.full_name.data
+        user.email = form.email.data
+        user.full_name = form.full_name.data
         if form.password.data:
-            current_user.set_password(form.password.data)
+            user.set_password(form.password.data)
         db.session.commit()
         flash('Profile updated successfully.')
         return redirect(url_for('routes.profile'))
@@ -71,14 +145,19 @@ def profile():
     effective_perms = current_user.get_effective_permissions()
     return render_template('profile.html', form=form, permissions=effective_perms)
 
+def _ticket_page():
+    try:
+        return list_tickets(current_user, request.args)
+    except ValueError:
+        abort(400)
+
 @main.route('/dashboard')
+@read_only
 @login_required
 def dashboard():
-    if current_user.is_admin():
-        tickets = Ticket.query.order_by(Ticket.created_at.desc()).all()
-    else:
-        tickets = Ticket.query.filter_by(user_id=current_user.id).order_by(Ticket.created_at.desc()).all()
-    return render_template('dashboard.html', tickets=tickets)
+    version = current_version(current_user)
+    page = _ticket_page()
+    return render_template('dashboard.html', tickets=page.tickets, page=page, version=version)
 
 @main.route('/ticket/create', methods=['GET','POST'])
 @login_required
@@ -90,67 +169,177 @@ def ticket_create():
     if form.validate_on_submit():
         ticket = Ticket(subject=form.subject.data, description=form.description.data, user_id=current_user.id)
         db.session.add(ticket)
+        filename = form_attachment(form, current_user.id)
+        if filename:
+            db.session.add(TicketReply(message="Initial attachment", ticket=ticket, user_id=current_user.id,
+                                       attachment=filename))
+        db.session.flush()
+        enqueue('realtime.ticket_event', action='created', ticket_id=ticket.id)
         db.session.commit()
-        if form.attachment.data:
-            filename = save_file(form.attachment.data)
-            reply = TicketReply(message="Initial attachment", ticket_id=ticket.id, user_id=current_user.id, attachment=filename)
-            db.session.add(reply)
-            db.session.commit()
-        socketio.emit('ticket_event', {'action': 'created', 'ticket_id': ticket.id}, broadcast=True)
         flash('Ticket created successfully.')
         return redirect(url_for('routes.dashboard'))
     return render_template('ticket_create.html', form=form)
 
 @main.route('/ticket/<int:ticket_id>', methods=['GET','POST'])
 @login_required
+@query_budget(16)
 def ticket_detail(ticket_id):
-    ticket = Ticket.query.get_or_404(ticket_id)
-    if not current_user.is_admin() and ticket.user_id != current_user.id:
+    ticket = find_ticket(ticket_id)
+    if ticket is None:
+        abort(404)
+    if not current_user.can_access_ticket(ticket):
         flash('Access denied.')
         return redirect(url_for('routes.dashboard'))
     form = TicketReplyForm()
     if form.validate_on_submit():
+        if ticket.archived:
+            flash('This ticket is archived and can no longer be replied to.')
+            return redirect(url_for('routes.ticket_detail', ticket_id=ticket.id))
         if not current_user.has_permission('reply_ticket'):
             flash("You do not have permission to reply to tickets.")
             return redirect(url_for('routes.ticket_detail', ticket_id=ticket.id))
-        filename = None
-        if form.attachment.data:
-            filename = save_file(form.attachment.data)
+        filename = form_attachment(form, current_user.id)
         reply = TicketReply(message=form.message.data, ticket_id=ticket.id, user_id=current_user.id, attachment=filename)
         db.session.add(reply)
+        db.session.flush()
+        enqueue('realtime.ticket_event', action='replied', ticket_id=ticket.id, reply_id=reply.id)
         db.session.commit()
-        socketio.emit('ticket_event', {'action': 'replied', 'ticket_id': ticket.id}, broadcast=True)
         flash('Reply submitted.')
         return redirect(url_for('routes.ticket_detail', ticket_id=ticket.id))
-    return render_template('ticket_detail.html', ticket=ticket, form=form)
+    try:
+        replies, next_cursor = list_replies(ticket, request.args)
+    except ValueError:
+        abort(400)
+    return render_template('ticket_detail.html', ticket=ticket, form=form,
+                           replies=replies, next_cursor=next_cursor)
 
 @main.route('/tickets_partial')
+@read_only
 @login_required
 def tickets_partial():
-    if current_user.is_admin():
-        tickets = Ticket.query.order_by(Ticket.created_at.desc()).all()
+    # The version is read before the list so a cached fragment is never
+    # newer than its key; an unchanged list costs one query and no render.
+    version = current_version(current_user)
+    args = sorted((key, value) for key, value in request.args.items(multi=True))
+    digest = hashlib.sha1(repr(args).encode()).hexdigest()[:16]
+    etag = f"{current_user.id}-{version}-{digest}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
     else:
-        tickets = Ticket.query.filter_by(user_id=current_user.id).order_by(Ticket.created_at.desc()).all()
-    return render_template('tickets_partial.html', tickets=tickets)
+        key = f"tickets_partial:{etag}"
+        html = fragment_cache().get(key)
+        if html is None:
+            page = _ticket_page()
+            html = render_template('tickets_partial.html', tickets=page.tickets, page=page, version=version)
+            fragment_cache().set(key, html, current_app.config['FRAGMENT_CACHE_TTL'])
+        response = make_response(html)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@main.route('/api/tickets/changes')
+@login_required
+def ticket_changes():
+    since = request.args.get('since', type=int)
+    if since is None:
+        abort(400)
+    delta = changes_since(current_user, since, parse_filters(request.args, current_user))
+    if delta is None:
+        return jsonify(resync=True, version=current_version(current_user))
+    return jsonify(delta)
+
+@main.route('/api/tickets')
+@login_required
+def tickets_api():
+    return jsonify(_ticket_page().to_dict())
+
+def _search_page():
+    return search(current_user, request.args.get('q', ''), page=request.args.get('page', 1, type=int))
+
+@main.route('/search')
+@login_required
+def search_view():
+    return render_template('search.html', page=_search_page())
+
+@main.route('/api/search')
+@login_required
+def search_api():
+    return jsonify(_search_page().to_dict())
 
 @main.route('/messages', methods=['GET','POST'])
 @login_required
 def private_messages():
     form = PrivateMessageForm()
-    form.recipient.choices = [(u.id, u.username) for u in User.query.filter(User.id != current_user.id).all()]
+    peer = None
+    peer_id = request.args.get('with', type=int) or form.recipient.data
+    if peer_id and peer_id != current_user.id:
+        peer = User.query.get(peer_id)
     if form.validate_on_submit():
-        filename = None
-        if form.attachment.data:
-            filename = save_file(form.attachment.data)
+        if peer is None:
+            flash('Choose a recipient.')
+            return redirect(url_for('routes.private_messages'))
+        filename = form_attachment(form, current_user.id)
         message = Message(body=form.body.data, sender_id=current_user.id,
-                          recipient_id=form.recipient.data, attachment=filename)
+                          recipient_id=peer.id, attachment=filename)
         db.session.add(message)
+        db.session.flush()
+        enqueue('realtime.private_message', message_id=message.id)
         db.session.commit()
-        socketio.emit('private_message', {
-            'sender': current_user.username,
-            'recipient_id': form.recipient.data,
-            'preview': form.body.data[:50]
-        }, broadcast=True)
         flash('Message sent.')
-        return redirect(url_for('routes.private_messages'))
-    return render_template('private_chat.html', form=form)
+        return redirect(url_for('routes.private_messages', **{'with': peer.id}))
+    conversations, conversations_cursor = list_conversations(current_user.id)
+    messages, history_cursor = [], None
+    if peer is not None:
+        form.recipient.data = peer.id
+        messages, history_cursor = conversation_history(current_user.id, peer.id)
+        mark_read(current_user.id, peer.id)
+    return render_template('private_chat.html', form=form, peer=peer,
+                           conversations=conversations, conversations_cursor=conversations_cursor,
+                           messages=list(reversed(messages)), history_cursor=history_cursor)
+
+@main.route('/messages/conversations')
+@login_required
+def conversations_api():
+    try:
+        conversations, next_cursor = list_conversations(
+            current_user.id, request.args.get('cursor'), request.args.get('limit'))
+    except ValueError:
+        abort(400)
+    return jsonify(conversations=[conversation_to_dict(c) for c in conversations], next_cursor=next_cursor)
+
+@main.route('/messages/<int:peer_id>/history')
+@login_required
+def message_history(peer_id):
+    try:
+        messages, next_cursor = conversation_history(
+            current_user.id, peer_id, request.args.get('cursor'), request.args.get('limit'))
+    except ValueError:
+        abort(400)
+    return jsonify(messages=[message_to_dict(m) for m in messages], next_cursor=next_cursor)
+
+@main.route('/messages/<int:peer_id>/read', methods=['POST'])
+@login_required
+def message_read(peer_id):
+    mark_read(current_user.id, peer_id)
+    return jsonify(status='ok')
+
+@main.route('/users/search')
+@login_required
+def user_search():
+    users = search_users(request.args.get('q'), current_user.id)
+    return jsonify(users=[{'id': u.id, 'username': u.username} for u in users])
+
+@main.route('/metrics')
+@limiter.exempt
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    authorized = token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized:
+        if not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        if not current_user.is_admin():
+            abort(403)
+    response = make_response(registry.exposition())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
@@ -0,0 +1,309 @@
+"""Full-text search over tickets, replies and private messages.
+
+Every searchable row has a ``SearchDocument`` carrying its text and the
+ids that decide who may see it. The text index is backend specific:
+
+* SQLite: an FTS5 table ``search_fts`` whose rowid is the document id,
+  ranked with ``bm25``.
+* PostgreSQL: the ``tsv`` column with a GIN index, ranked with ``ts_rank``.
+* Anything else falls back to ``LIKE`` and newest-first ordering.
+
+Documents are written in the same flush as the rows they describe;
+``flask search reindex`` rebuilds everything.
+"""
+import re
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from sqlalchemy import DDL, and_, column, delete, event, func, insert, inspect, literal, \
+    literal_column, or_, select, table, update
+
+from app import db
+from models import Ticket, TicketReply, Message, SearchDocument
+
+KIND_TICKET = 'ticket'
+KIND_REPLY = 'reply'
+KIND_MESSAGE = 'message'
+TERM = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 16
+
+fts = table('search_fts', column('rowid'), column('body'))
+
+event.listen(SearchDocument.__table__, 'after_create',
+             DDL('CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(body)').execute_if(dialect='sqlite'))
+event.listen(SearchDocument.__table__, 'after_create',
+             DDL('CREATE INDEX IF NOT EXISTS ix_search_document_tsv ON search_document USING gin (tsv)')
+             .execute_if(dialect='postgresql'))
+event.listen(SearchDocument.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS search_fts').execute_if(dialect='sqlite'))
+
+
+def _language():
+    try:
+        return current_app.config['SEARCH_LANGUAGE']
+    except RuntimeError:
+        return 'english'
+
+
+def _tsvector(value):
+    return func.to_tsvector(_language(), value)
+
+
+# Incremental maintenance, run inside the flush that changes the source row.
+
+def _write(connection, kind, ref_id, values):
+    dialect = connection.dialect.name
+    values = dict(values, kind=kind, ref_id=ref_id)
+    if dialect == 'postgresql':
+        values['tsv'] = _tsvector(values['body'])
+    doc_id = connection.scalar(select(SearchDocument.id).where(
+        SearchDocument.kind == kind, SearchDocument.ref_id == ref_id))
+    if doc_id is None:
+        doc_id = connection.execute(insert(SearchDocument).values(**values)).inserted_primary_key[0]
+    else:
+        connection.execute(update(SearchDocument).where(SearchDocument.id == doc_id).values(**values))
+    if dialect == 'sqlite':
+        connection.execute(delete(fts).where(fts.c.rowid == doc_id))
+        connection.execute(insert(fts).values(rowid=doc_id, body=values['body']))
+
+
+def _remove(connection, *criteria):
+    if connection.dialect.name == 'sqlite':
+        ids = select(SearchDocument.id).where(*criteria)
+        connection.execute(delete(fts).where(fts.c.rowid.in_(ids)))
+    connection.execute(delete(SearchDocument).where(*criteria))
+
+
+def _changed(target, *fields):
+    state = inspect(target)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _ticket_body(ticket):
+    return f"{ticket.subject}\n{ticket.description}"
+
+
+@event.listens_for(Ticket, 'after_insert')
+def _ticket_inserted(mapper, connection, ticket):
+    _write(connection, KIND_TICKET, ticket.id, {
+        'ticket_id': ticket.id, 'owner_id': ticket.user_id,
+        'created_at': ticket.created_at, 'body': _ticket_body(ticket),
+    })
+
+
+@event.listens_for(Ticket, 'after_update')
+def _ticket_updated(mapper, connection, ticket):
+    if _changed(ticket, 'subject', 'description', 'user_id'):
+        _ticket_inserted(mapper, connection, ticket)
+    if _changed(ticket, 'user_id'):
+        connection.execute(update(SearchDocument).where(
+            SearchDocument.kind == KIND_REPLY, SearchDocument.ticket_id == ticket.id,
+        ).values(owner_id=ticket.user_id))
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _ticket_deleted(mapper, connection, ticket):
+    _remove(connection, SearchDocument.kind.in_((KIND_TICKET, KIND_REPLY)),
+            SearchDocument.ticket_id == ticket.id)
+
+
+@event.listens_for(TicketReply, 'after_insert')
+def _reply_inserted(mapper, connection, reply):
+    owner_id = connection.scalar(select(Ticket.user_id).where(Ticket.id == reply.ticket_id))
+    _write(connection, KIND_REPLY, reply.id, {
+        'ticket_id': reply.ticket_id, 'owner_id': owner_id,
+        'created_at': reply.created_at, 'body': reply.message,
+    })
+
+
+@event.listens_for(TicketReply, 'after_update')
+def _reply_updated(mapper, connection, reply):
+    if _changed(reply, 'message', 'ticket_id'):
+        _reply_inserted(mapper, connection, reply)
+
+
+@event.listens_for(TicketReply, 'after_delete')
+def _reply_deleted(mapper, connection, reply):
+    _remove(connection, SearchDocument.kind == KIND_REPLY, SearchDocument.ref_id == reply.id)
+
+
+@event.listens_for(Message, 'after_insert')
+def _message_inserted(mapper, connection, message):
+    _write(connection, KIND_MESSAGE, message.id, {
+        'owner_id': message.sender_id, 'peer_id': message.recipient_id,
+        'created_at': message.timestamp, 'body': message.body,
+    })
+
+
+@event.listens_for(Message, 'after_update')
+def _message_updated(mapper, connection, message):
+    if _changed(message, 'body', 'sender_id', 'recipient_id'):
+        _message_inserted(mapper, connection, message)
+
+
+@event.listens_for(Message, 'after_delete')
+def _message_deleted(mapper, connection, message):
+    _remove(connection, SearchDocument.kind == KIND_MESSAGE, SearchDocument.ref_id == message.id)
+
+
+# Querying
+
+def parse_terms(query):
+    return TERM.findall(query or '')[:MAX_TERMS]
+
+
+def visible_to(user):
+    """SQL criterion restricting documents to those ``user`` may open."""
+    messages = and_(SearchDocument.kind == KIND_MESSAGE,
+                    or_(SearchDocument.owner_id == user.id, SearchDocument.peer_id == user.id))
+    if user.is_admin():
+        return or_(SearchDocument.kind != KIND_MESSAGE, messages)
+    return or_(and_(SearchDocument.kind != KIND_MESSAGE, SearchDocument.owner_id == user.id), messages)
+
+
+def _ranked_query(terms, dialect):
+    if dialect == 'sqlite':
+        # Quote every term so user input is never parsed as FTS5 syntax;
+        # the last one is a prefix match to suit search-as-you-type.
+        match = ' '.join('"%s"' % term for term in terms) + '*'
+        rank = func.bm25(literal_column('search_fts'))
+        return db.session.query(SearchDocument, rank.label('rank')) \
+            .join(fts, fts.c.rowid == SearchDocument.id) \
+            .filter(literal_column('search_fts').op('MATCH')(match)) \
+            .order_by(rank, SearchDocument.id.desc())
+    if dialect == 'postgresql':
+        tsquery = func.plainto_tsquery(_language(), ' '.join(terms))
+        rank = func.ts_rank(SearchDocument.tsv, tsquery)
+        return db.session.query(SearchDocument, rank.label('rank')) \
+            .filter(SearchDocument.tsv.op('@@')(tsquery)) \
+            .order_by(rank.desc(), SearchDocument.id.desc())
+    query = db.session.query(SearchDocument, literal_column('0').label('rank'))
+    for term in terms:
+        query = query.filter(SearchDocument.body.ilike(f'%{term}%'))
+    return query.order_by(SearchDocument.created_at.desc(), SearchDocument.id.desc())
+
+
+class SearchResult:
+    def __init__(self, document, user, rank):
+        self.document = document
+        self.user = user
+        self.rank = rank
+
+    @property
+    def url(self):
+        document = self.document
+        if document.kind == KIND_MESSAGE:
+            peer_id = document.peer_id if document.owner_id == self.user.id else document.owner_id
+            return url_for('routes.private_messages', **{'with': peer_id})
+        anchor = f'reply-{document.ref_id}' if document.kind == KIND_REPLY else None
+        return url_for('routes.ticket_detail', ticket_id=document.ticket_id, _anchor=anchor)
+
+    @property
+    def excerpt(self):
+        body = ' '.join(self.document.body.split())
+        return body if len(body) <= 200 else body[:200] + '...'
+
+    def to_dict(self):
+        return {
+            'kind': self.document.kind,
+            'id': self.document.ref_id,
+            'ticket_id': self.document.ticket_id,
+            'created_at': self.document.created_at.isoformat() if self.document.created_at else None,
+            'excerpt': self.excerpt,
+            'url': self.url,
+            'rank': self.rank,
+        }
+
+
+class SearchPage:
+    def __init__(self, query, results, page, has_next):
+        self.query = query
+        self.results = results
+        self.page = page
+        self.has_next = has_next
+
+    def to_dict(self):
+        return {
+            'q': self.query,
+            'page': self.page,
+            'has_next': self.has_next,
+            'results': [result.to_dict() for result in self.results],
+        }
+
+
+def search(user, query, page=1, per_page=None):
+    """One page of documents matching ``query`` that ``user`` may see, best first."""
+    per_page = per_page or current_app.config['SEARCH_RESULTS_PER_PAGE']
+    page = max(page, 1)
+    terms = parse_terms(query)
+    if not terms:
+        return SearchPage(query, [], page, False)
+    rows = _ranked_query(terms, db.engine.dialect.name).filter(visible_to(user)) \
+        .offset((page - 1) * per_page).limit(per_page + 1).all()
+    results = [SearchResult(document, user, rank) for document, rank in rows[:per_page]]
+    return SearchPage(query, results, page, len(rows) > per_page)
+
+
+SOURCE_COLUMNS = ['kind', 'ref_id', 'ticket_id', 'owner_id', 'peer_id', 'created_at', 'body']
+
+
+def _ticket_sources():
+    return [
+        select(literal(KIND_TICKET), Ticket.id, Ticket.id, Ticket.user_id, literal(None),
+               Ticket.created_at, Ticket.subject + '\n' + Ticket.description),
+        select(literal(KIND_REPLY), TicketReply.id, TicketReply.ticket_id, Ticket.user_id, literal(None),
+               TicketReply.created_at, TicketReply.message)
+        .join(Ticket, Ticket.id == TicketReply.ticket_id, isouter=True),
+    ]
+
+
+def unindex_tickets(connection, ticket_ids):
+    """Drop the documents of ``ticket_ids`` and their replies."""
+    _remove(connection, SearchDocument.kind.in_((KIND_TICKET, KIND_REPLY)),
+            SearchDocument.ticket_id.in_(ticket_ids))
+
+
+def index_tickets(connection, ticket_ids):
+    """(Re)write the documents of ``ticket_ids`` and their replies in one statement per kind."""
+    unindex_tickets(connection, ticket_ids)
+    for source in _ticket_sources():
+        connection.execute(insert(SearchDocument).from_select(
+            SOURCE_COLUMNS, source.where(Ticket.id.in_(ticket_ids))))
+    documents = (SearchDocument.kind.in_((KIND_TICKET, KIND_REPLY)), SearchDocument.ticket_id.in_(ticket_ids))
+    if connection.dialect.name == 'sqlite':
+        connection.execute(insert(fts).from_select(
+            ['rowid', 'body'], select(SearchDocument.id, SearchDocument.body).where(*documents)))
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(update(SearchDocument).where(*documents).values(tsv=_tsvector(SearchDocument.body)))
+
+
+def reindex():
+    """Rebuild every search document from the source tables."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(delete(fts))
+    db.session.execute(delete(SearchDocument))
+    sources = _ticket_sources() + [
+        select(literal(KIND_MESSAGE), Message.id, literal(None), Message.sender_id, Message.recipient_id,
+               Message.timestamp, Message.body),
+    ]
+    for source in sources:
+        db.session.execute(insert(SearchDocument).from_select(SOURCE_COLUMNS, source))
+    if dialect == 'sqlite':
+        db.session.execute(insert(fts).from_select(['rowid', 'body'],
+                                                   select(SearchDocument.id, SearchDocument.body)))
+    elif dialect == 'postgresql':
+        db.session.execute(update(SearchDocument).values(tsv=_tsvector(SearchDocument.body)))
+    db.session.commit()
+    return db.session.query(func.count(SearchDocument.id)).scalar()
+
+
+search_cli = AppGroup('search', help='Full-text search index.')
+
+
+@search_cli.command('reindex')
+def reindex_command():
+    """Rebuild the search index from tickets, replies and messages."""
+    documents = reindex()
+    click.echo(f"Indexed {documents} documents.")
@@ -33,30 +33,356 @@ $(document).ready(function() {
     });
   }
   
+  function escapeHtml(text) {
+    return $('<div>').text(text == null ? '' : text).html();
+  }
+
+  var viewedTicketId = $('#ticket-heading').data('ticket-id');
+
+  socket.on('connect', function() {
+    if (viewedTicketId) {
+      socket.emit('join_ticket', {ticket_id: viewedTicketId});
+    }
+    resyncTicketList();
+  });
+
+  function renderTicketRow(ticket) {
+    return '<tr data-ticket-id="' + ticket.id + '">' +
+      '<td>' + escapeHtml(ticket.number) + '</td>' +
+      '<td><a href="' + (ticket.url || '/ticket/' + ticket.id) + '">' + escapeHtml(ticket.subject) + '</a></td>' +
+      '<td class="ticket-status">' + escapeHtml(ticket.status) + '</td>' +
+      '<td>' + ticket.created_at.slice(0, 10) + '</td>' +
+      '</tr>';
+  }
+
+  // Ticket tables are patched from ticket_diff; this only updates the detail view.
+  function applyTicketEvent(data) {
+    if (data.ticket.id === viewedTicketId) {
+      $('.ticket-status').text(data.ticket.status);
+    }
+  }
+
+  function matchesFilters(ticket) {
+    var filters = $('#ticket-list').data('filters') || {};
+    var fields = {status: 'status', priority: 'priority', assignee: 'assigned_to', author: 'user_id'};
+    return Object.keys(fields).every(function(name) {
+      if (filters[name] === undefined || filters[name] === null) {
+        return true;
+      }
+      var value = ticket[fields[name]];
+      return filters[name] === 'none' ? value === null : String(value) === String(filters[name]);
+    });
+  }
+
+  // Patch the rendered table with a {version, changes} delta, pushed or fetched.
+  function applyTicketDiff(delta) {
+    var table = $('#ticket-table');
+    if (!table.length || delta.version <= parseInt(table.attr('data-version'), 10)) {
+      return;
+    }
+    if (delta.resync) {
+      // Too many rows changed (e.g. a bulk update) to patch one by one.
+      reloadTicketList();
+      return;
+    }
+    delta.changes.forEach(function(change) {
+      var row = table.find('tr[data-ticket-id="' + change.id + '"]');
+      if (change.action === 'remove' || (change.ticket && !matchesFilters(change.ticket))) {
+        row.remove();
+      } else if (!change.ticket) {
+        return;
+      } else if (row.length) {
+        row.replaceWith(renderTicketRow(change.ticket));
+      } else if (change.action === 'insert') {
+        table.find('tbody').prepend(renderTicketRow(change.ticket));
+      }
+    });
+    table.attr('data-version', delta.version);
+  }
+
+  socket.on('ticket_diff', applyTicketDiff);
+
+  // Admin bulk updates: submit over fetch so chunk progress can be shown.
+  $('#bulk-update-form').on('submit', function(event) {
+    event.preventDefault();
+    var form = $(this);
+    var operation = Date.now().toString(36) + Math.random().toString(36).slice(2);
+    var body = {operation: operation, filters: $('#ticket-list').data('filters') || {}};
+    form.serializeArray().forEach(function(field) {
+      if (field.value !== '' && field.name !== 'csrf_token' && field.name !== 'all') {
+        body[field.name] = field.value;
+      }
+    });
+    if ($.isEmptyObject(body.filters)) {
+      // No filters means every ticket; make sure that is what the admin wants.
+      if (!window.confirm('No filters are set. Apply this change to every ticket?')) {
+        return;
+      }
+      body.all = true;
+    }
+    form.data('operation', operation).find('button').prop('disabled', true);
+    $('#bulk-progress').text('Starting…');
+    $.ajax({
+      url: form.attr('action'),
+      method: 'POST',
+      contentType: 'application/json',
+      data: JSON.stringify(body),
+      success: function(result) {
+        $('#bulk-progress').text('Updated ' + result.updated + ' of ' + result.matched + ' tickets.');
+      },
+      error: function(xhr) {
+        $('#bulk-progress').text((xhr.responseJSON && xhr.responseJSON.error) || 'Bulk update failed.');
+      },
+      complete: function() {
+        form.find('button').prop('disabled', false);
+      }
+    });
+  });
+
+  socket.on('bulk_progress', function(data) {
+    if (data.operation === $('#bulk-update-form').data('operation')) {
+      $('#bulk-progress').text(data.done + ' / ' + data.total + ' checked, ' + data.updated + ' updated…');
+    }
+  });
+
+  // After (re)connecting, catch up on anything pushed while we were away.
+  function resyncTicketList() {
+    var table = $('#ticket-table');
+    if (!$('#ticket-list').length || !table.length) {
+      return;
+    }
+    socket.emit('ticket_resync', {
+      since: parseInt(table.attr('data-version'), 10),
+      filters: $('#ticket-list').data('filters') || {}
+    }, function(delta) {
+      if (delta.resync) {
+        reloadTicketList();
+      } else {
+        applyTicketDiff(delta);
+      }
+    });
+  }
+
   socket.on('ticket_event', function(data) {
     console.log("Ticket Event:", data);
+    applyTicketEvent(data);
     updateBadge('#ticket-notification-badge', 1);
-    showToast('Ticket Update', 'A ticket event has occurred. Check your dashboard.');
+    showToast('Ticket Update', escapeHtml(data.ticket.number + ' was ' + data.action + '.'));
   });
   
+  function renderMessage(message, own) {
+    var preview = message.thumbnail_url
+      ? '<a href="' + escapeHtml(message.attachment_url) + '"><img src="' + escapeHtml(message.thumbnail_url) +
+        '" class="img-thumbnail d-block mb-1" alt="Attachment preview" loading="lazy"></a>' : '';
+    var attachment = message.attachment_url
+      ? preview + '<a href="' + escapeHtml(message.attachment_url) + '">Attachment</a>' : '';
+    return '<div class="message' + (own ? ' text-right' : '') + '" data-message-id="' + message.id + '">' +
+      '<small class="text-muted">' + escapeHtml(message.timestamp.replace('T', ' ').slice(0, 16)) + '</small>' +
+      '<p>' + escapeHtml(message.body) + '</p>' + attachment + '</div>';
+  }
+
+  var openPeerId = parseInt($('#conversation').data('peer-id'), 10) || null;
+
   socket.on('private_message', function(data) {
     console.log("Private Message:", data);
+    if (data.sender_id === openPeerId) {
+      $.getJSON('/messages/' + openPeerId + '/history', {limit: 5}, function(response) {
+        response.messages.reverse().forEach(function(message) {
+          if (!$('#message-list [data-message-id="' + message.id + '"]').length) {
+            $('#message-list').append(renderMessage(message, false));
+          }
+        });
+      });
+      $.post('/messages/' + openPeerId + '/read');
+      return;
+    }
+    var item = $('#conversation-list [data-peer-id="' + data.sender_id + '"]');
+    if (item.length) {
+      item.find('.conversation-preview').text(data.preview);
+      var unread = item.find('.conversation-unread');
+      if (!unread.length) {
+        unread = $('<span class="badge badge-primary badge-pill conversation-unread">0</span>').appendTo(item);
+      }
+      unread.text((parseInt(unread.text(), 10) || 0) + 1);
+      item.parent().prepend(item);
+    }
     updateBadge('#msg-notification-badge', 1);
-    showToast('New Message', 'You received a new message from ' + data.sender);
+    showToast('New Message', 'You received a new message from ' + escapeHtml(data.sender));
+  });
+
+  $(document).on('click', '.message-load-older', function(e) {
+    e.preventDefault();
+    var link = $(this);
+    $.getJSON(link.attr('href'), function(response) {
+      var own = function(message) { return message.sender_id !== openPeerId; };
+      response.messages.forEach(function(message) {
+        $('#message-list').prepend(renderMessage(message, own(message)));
+      });
+      if (response.next_cursor) {
+        link.attr('href', '/messages/' + openPeerId + '/history?cursor=' + encodeURIComponent(response.next_cursor));
+      } else {
+        link.remove();
+      }
+    });
+  });
+
+  $(document).on('click', '.conversation-load-more', function(e) {
+    e.preventDefault();
+    var link = $(this);
+    $.getJSON(link.attr('href'), function(response) {
+      response.conversations.forEach(function(conversation) {
+        $('#conversation-list').append(
+          '<li class="list-group-item d-flex justify-content-between align-items-center" data-peer-id="' +
+          conversation.peer_id + '"><a href="/messages?with=' + conversation.peer_id + '">' +
+          escapeHtml(conversation.peer) + '</a><small class="text-muted conversation-preview">' +
+          escapeHtml(conversation.last_preview || '') + '</small></li>'
+        );
+      });
+      if (response.next_cursor) {
+        link.attr('href', '/messages/conversations?cursor=' + encodeURIComponent(response.next_cursor));
+      } else {
+        link.remove();
+      }
+    });
+  });
+
+  // Recipient typeahead: debounced prefix search instead of a full user dropdown.
+  var searchTimer = null;
+  $(document).on('input', '#recipient-search', function() {
+    var input = $(this);
+    $('#recipient').val('');
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(function() {
+      var term = input.val().trim();
+      if (!term) {
+        $('#recipient-results').empty();
+        return;
+      }
+      $.getJSON(input.data('source'), {q: term}, function(response) {
+        $('#recipient-results').html(response.users.map(function(user) {
+          return '<a href="#" class="list-group-item list-group-item-action recipient-option" data-user-id="' +
+            user.id + '">' + escapeHtml(user.username) + '</a>';
+        }).join(''));
+      });
+    }, 200);
+  });
+
+  $(document).on('click', '.recipient-option', function(e) {
+    e.preventDefault();
+    window.location = '/messages?with=' + $(this).data('user-id');
   });
   
-  function refreshTicketList() {
+  $(document).on('click', '.ticket-load-more', function(e) {
+    e.preventDefault();
+    var link = $(this);
+    $.get(link.attr('href'), function(response) {
+      var page = $('<div>').html(response);
+      $('#ticket-table tbody').append(page.find('#ticket-table tbody tr'));
+      link.replaceWith(page.find('.ticket-load-more'));
+    });
+  });
+
+  // Large attachments go up in resumable chunks before the form is posted.
+  var CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+  var CHUNK_RETRIES = 5;
+
+  function uploadInChunks(file, onProgress) {
+    var done = $.Deferred();
+    var retries = 0;
+
+    function sendNext(status) {
+      onProgress(status.offset / status.size);
+      if (status.complete) {
+        done.resolve(status.upload_id);
+        return;
+      }
+      var end = Math.min(status.offset + status.chunk_size, status.size);
+      $.ajax({
+        url: '/uploads/sessions/' + status.upload_id,
+        method: 'PUT',
+        data: file.slice(status.offset, end),
+        processData: false,
+        contentType: 'application/octet-stream',
+        headers: {'Content-Range': 'bytes ' + status.offset + '-' + (end - 1) + '/' + status.size}
+      }).done(function(next) {
+        retries = 0;
+        sendNext(next);
+      }).fail(function() {
+        if (++retries > CHUNK_RETRIES) {
+          done.reject();
+          return;
+        }
+        // Ask the server where to resume, then carry on from there.
+        setTimeout(function() {
+          $.getJSON('/uploads/sessions/' + status.upload_id).done(sendNext).fail(done.reject);
+        }, 1000 * retries);
+      });
+    }
+
     $.ajax({
-      url: '/tickets_partial',
+      url: '/uploads/sessions',
+      method: 'POST',
+      contentType: 'application/json',
+      data: JSON.stringify({filename: file.name, size: file.size})
+    }).done(sendNext).fail(done.reject);
+    return done.promise();
+  }
+
+  $(document).on('submit', 'form[enctype="multipart/form-data"]', function(e) {
+    var form = this;
+    var input = $(form).find('input[type="file"]')[0];
+    if (!input || !input.files.length || input.files[0].size < CHUNKED_UPLOAD_THRESHOLD) {
+      return;
+    }
+    e.preventDefault();
+    var button = $(form).find('[type="submit"]').prop('disabled', true);
+    uploadInChunks(input.files[0], function(fraction) {
+      button.val('Uploading ' + Math.round(fraction * 100) + '%');
+    }).done(function(uploadId) {
+      $(form).find('input[name="upload_id"]').val(uploadId);
+      input.value = '';
+      form.submit();
+    }).fail(function() {
+      button.prop('disabled', false).val('Retry upload');
+      showToast('Upload failed', 'The attachment could not be uploaded.');
+    });
+  });
+
+  function reloadTicketList() {
+    var list = $('#ticket-list');
+    $.ajax({
+      url: list.data('source'),
       method: 'GET',
       success: function(response) {
-        $('#ticket-list-container').html(response);
+        list.html(response);
       },
       error: function() {
         console.error("Error refreshing ticket list.");
       }
     });
   }
+
+  function refreshTicketList() {
+    var list = $('#ticket-list');
+    var table = $('#ticket-table');
+    if (!list.length) {
+      return;
+    }
+    if (!list.data('changes') || !table.length) {
+      reloadTicketList();
+      return;
+    }
+    $.getJSON(list.data('changes'), {since: table.attr('data-version')}, function(delta) {
+      if (delta.resync) {
+        reloadTicketList();
+      } else {
+        applyTicketDiff(delta);
+      }
+    });
+  }
   
-  setInterval(refreshTicketList, 60000);
+  var pollInterval = parseInt($('#ticket-list').data('poll-interval'), 10) || 0;
+  if (pollInterval > 0) {
+    setInterval(refreshTicketList, pollInterval * 1000);
+  }
 });
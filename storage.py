@@ -0,0 +1,358 @@
+"""Content-addressed attachment storage.
+
+Uploads are hashed while they stream to disk and stored once per digest at
+``UPLOAD_FOLDER/ab/cd/<sha256>``. Rows keep referring to files by name; a
+content-addressed name is ``<sha256>_<original name>`` so the digest doubles
+as the ETag and the original name as the download name. Files saved before
+this scheme (``<uuid>_<name>`` at the top level) keep working.
+
+``Blob.ref_count`` tracks how many ``TicketReply``/``Message`` rows (archived
+replies included) point at each digest; ``flask storage gc`` removes blobs nobody references.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, union_all
+from werkzeug.utils import secure_filename
+
+from app import db
+from database import upsert
+from models import ArchivedTicketReply, Blob, TicketReply, Message
+
+CAS_NAME = re.compile(r'^(?P<digest>[0-9a-f]{64})_(?P<name>.+)$')
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+COPY_CHUNK_SIZE = 1024 * 1024
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+# Derived previews live next to their attachment (see thumbnails.py)
+PREVIEW_SUFFIX = '.thumb.jpg'
+
+
+def upload_root():
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def digest_of(attachment):
+    """Return the SHA-256 embedded in a content-addressed name, else None."""
+    match = CAS_NAME.match(attachment or '')
+    return match.group('digest') if match else None
+
+
+def blob_relpath(digest):
+    return os.path.join(digest[:2], digest[2:4], digest)
+
+
+def resolve_path(attachment):
+    """Filesystem path of an attachment name, or None if the name is unsafe."""
+    digest = digest_of(attachment)
+    if digest:
+        return os.path.join(upload_root(), blob_relpath(digest))
+    if attachment != os.path.basename(attachment) or attachment.startswith('.'):
+        return None
+    return os.path.join(upload_root(), attachment)
+
+
+def relative_path(attachment):
+    digest = digest_of(attachment)
+    return blob_relpath(digest) if digest else attachment
+
+
+def _temp_dir():
+    path = os.path.join(upload_root(), 'tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _commit_blob(temp_path, digest):
+    """Move a fully written temp file into place, or drop it if the blob exists."""
+    target = os.path.join(upload_root(), blob_relpath(digest))
+    if os.path.exists(target):
+        os.remove(temp_path)
+        # Fresh mtime keeps gc from removing a blob that is about to be re-referenced
+        os.utime(target)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+    return target
+
+
+def store_stream(stream, filename):
+    """Hash ``stream`` while copying it to disk; return the attachment name."""
+    sha = hashlib.sha256()
+    temp_path = os.path.join(_temp_dir(), uuid.uuid4().hex)
+    with open(temp_path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+            sha.update(chunk)
+            out.write(chunk)
+    digest = sha.hexdigest()
+    _commit_blob(temp_path, digest)
+    return f"{digest}_{secure_filename(filename)}"
+
+
+# Resumable uploads: a session is a .part file plus a JSON sidecar in tmp/,
+# so any worker sharing UPLOAD_FOLDER can accept the next chunk. A user may
+# hold UPLOAD_MAX_SESSIONS unfinished ones; gc expires abandoned sessions.
+
+class UploadError(ValueError):
+    pass
+
+
+def _session_paths(upload_id):
+    if not UPLOAD_ID.match(upload_id or ''):
+        raise UploadError('Unknown upload.')
+    base = os.path.join(_temp_dir(), f'upload-{upload_id}')
+    return base + '.part', base + '.json'
+
+
+def _read_session(upload_id, user_id):
+    part_path, meta_path = _session_paths(upload_id)
+    try:
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+    except FileNotFoundError:
+        raise UploadError('Unknown upload.')
+    if meta['user_id'] != user_id:
+        raise UploadError('Unknown upload.')
+    meta['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    return meta
+
+
+def _write_session(upload_id, meta):
+    _, meta_path = _session_paths(upload_id)
+    temp = f'{meta_path}.{uuid.uuid4().hex}'
+    with open(temp, 'w') as fh:
+        json.dump({key: value for key, value in meta.items() if key != 'offset'}, fh)
+    os.replace(temp, meta_path)
+
+
+def _open_sessions(user_id):
+    count = 0
+    for name in os.listdir(_temp_dir()):
+        if not (name.startswith('upload-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(_temp_dir(), name)) as fh:
+                count += json.load(fh)['user_id'] == user_id
+        except (FileNotFoundError, ValueError, KeyError):
+            continue
+    return count
+
+
+def start_upload(user_id, filename, size):
+    if size <= 0 or size > current_app.config['MAX_UPLOAD_SIZE']:
+        raise UploadError('Upload size is not allowed.')
+    if _open_sessions(user_id) >= current_app.config['UPLOAD_MAX_SESSIONS']:
+        raise UploadError('Too many unfinished uploads; finish or abandon one first.')
+    upload_id = uuid.uuid4().hex
+    part_path, _ = _session_paths(upload_id)
+    open(part_path, 'wb').close()
+    meta = {'user_id': user_id, 'filename': secure_filename(filename), 'size': size,
+            'attachment': None, 'created': time.time()}
+    _write_session(upload_id, meta)
+    return upload_status(upload_id, user_id)
+
+
+def upload_status(upload_id, user_id):
+    meta = _read_session(upload_id, user_id)
+    return {
+        'upload_id': upload_id,
+        'offset': meta['offset'] if not meta['attachment'] else meta['size'],
+        'size': meta['size'],
+        'complete': bool(meta['attachment']),
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+    }
+
+
+def append_chunk(upload_id, user_id, start, stream):
+    """Append bytes at ``start``; finishes the upload once all bytes arrived.
+
+    The ``.part`` file is locked while a chunk is written, so a retried PUT
+    that races the original is refused instead of appending the bytes twice.
+    """
+    meta = _read_session(upload_id, user_id)
+    if meta['attachment']:
+        return upload_status(upload_id, user_id)
+    part_path, _ = _session_paths(upload_id)
+    with open(part_path, 'ab') as out:
+        try:
+            # Never wait: under eventlet a blocking flock would stall the whole worker
+            fcntl.flock(out, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Another chunk of this upload is still being written.')
+        # The chunk that held the lock before us may have finished the upload
+        meta = _read_session(upload_id, user_id)
+        if meta['attachment']:
+            return upload_status(upload_id, user_id)
+        offset = os.fstat(out.fileno()).st_size
+        if start != offset:
+            raise UploadError(f"Expected chunk at offset {offset}.")
+        limit = meta['size'] - start
+        for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+            if len(chunk) > limit:
+                raise UploadError('Chunk runs past the declared size.')
+            limit -= len(chunk)
+            out.write(chunk)
+        out.flush()
+        if os.fstat(out.fileno()).st_size == meta['size']:
+            with open(part_path, 'rb') as fh:
+                sha = hashlib.sha256()
+                for chunk in iter(lambda: fh.read(COPY_CHUNK_SIZE), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            _commit_blob(part_path, digest)
+            meta['attachment'] = f"{digest}_{meta['filename']}"
+            _write_session(upload_id, meta)
+    return upload_status(upload_id, user_id)
+
+
+def claim_upload(upload_id, user_id):
+    """Return the attachment name of a finished upload and close its session."""
+    if not upload_id:
+        return None
+    try:
+        meta = _read_session(upload_id, user_id)
+    except UploadError:
+        return None
+    if not meta['attachment']:
+        return None
+    part_path, meta_path = _session_paths(upload_id)
+    for path in (part_path, meta_path):
+        if os.path.exists(path):
+            os.remove(path)
+    return meta['attachment']
+
+
+# Reference counting: rows pointing at a digest, adjusted in the flush
+# that adds or removes them.
+
+def _adjust_refs(connection, attachment, delta):
+    digest = digest_of(attachment)
+    if not digest:
+        return
+    released_at = datetime.utcnow() if delta < 0 else None
+    path = os.path.join(upload_root(), blob_relpath(digest))
+    size = os.path.getsize(path) if os.path.exists(path) else None
+    # One statement, so two new uploads of the same content cannot both insert
+    connection.execute(
+        upsert(connection, Blob)
+        .values(sha256=digest, size=size, ref_count=max(delta, 0), created_at=datetime.utcnow(),
+                released_at=released_at)
+        .on_conflict_do_update(index_elements=['sha256'],
+                               set_={'ref_count': Blob.ref_count + delta, 'released_at': released_at})
+    )
+
+
+def _attachment_inserted(mapper, connection, target):
+    _adjust_refs(connection, target.attachment, 1)
+
+
+def _attachment_deleted(mapper, connection, target):
+    _adjust_refs(connection, target.attachment, -1)
+
+
+def _attachment_updated(mapper, connection, target):
+    history = inspect(target).attrs.attachment.history
+    if history.has_changes():
+        for old in history.deleted:
+            _adjust_refs(connection, old, -1)
+        for new in history.added:
+            _adjust_refs(connection, new, 1)
+
+
+for _model in (TicketReply, Message):
+    event.listen(_model, 'after_insert', _attachment_inserted)
+    event.listen(_model, 'after_delete', _attachment_deleted)
+    event.listen(_model, 'after_update', _attachment_updated)
+
+
+def reference_counts():
+    """Actual references per digest, computed from the attachment columns."""
+    names = union_all(*[
+        db.select(model.attachment.label('attachment')).where(model.attachment.isnot(None))
+        for model in (TicketReply, ArchivedTicketReply, Message)
+    ]).subquery()
+    digest = func.substr(names.c.attachment, 1, 64)
+    rows = db.session.execute(db.select(digest, func.count()).group_by(digest))
+    return {value: count for value, count in rows if DIGEST.match(value or '')}
+
+
+def recount():
+    """Reset every Blob.ref_count from the attachment columns."""
+    counts = reference_counts()
+    now = datetime.utcnow()
+    for blob in Blob.query.all():
+        refs = counts.pop(blob.sha256, 0)
+        if blob.ref_count != refs:
+            blob.ref_count = refs
+            blob.released_at = now if refs == 0 else None
+    for digest, refs in counts.items():
+        path = os.path.join(upload_root(), blob_relpath(digest))
+        db.session.add(Blob(sha256=digest, ref_count=refs,
+                            size=os.path.getsize(path) if os.path.exists(path) else None))
+    db.session.commit()
+
+
+def collect_garbage(grace, dry_run=False):
+    """Delete unreferenced blobs, orphaned files and stale upload sessions older than ``grace``."""
+    cutoff = datetime.utcnow() - grace
+    removed = []
+    for blob in Blob.query.filter(Blob.ref_count <= 0, Blob.released_at < cutoff).all():
+        path = os.path.join(upload_root(), blob_relpath(blob.sha256))
+        if os.path.exists(path) and os.path.getmtime(path) >= cutoff.timestamp():
+            continue
+        removed.append(path)
+        if not dry_run:
+            if os.path.exists(path):
+                os.remove(path)
+            db.session.delete(blob)
+
+    known = {sha for (sha,) in db.session.query(Blob.sha256)}
+    cutoff_ts = cutoff.timestamp()
+    for shard, _, files in os.walk(upload_root()):
+        relative = os.path.relpath(shard, upload_root())
+        for name in files:
+            path = os.path.join(shard, name)
+            if os.path.getmtime(path) >= cutoff_ts:
+                continue
+            orphan_blob = relative.count(os.sep) == 1 and DIGEST.match(name) and name not in known
+            stale_temp = relative == 'tmp'
+            orphan_preview = False
+            if PREVIEW_SUFFIX in name:
+                # A preview (or an abandoned partial one) whose attachment is gone
+                source = path[:path.index(PREVIEW_SUFFIX, len(shard))]
+                orphan_preview = not name.endswith(PREVIEW_SUFFIX) or source in removed \
+                    or not os.path.exists(source)
+            if orphan_blob or stale_temp or orphan_preview:
+                removed.append(path)
+                if not dry_run:
+                    os.remove(path)
+    if not dry_run:
+        db.session.commit()
+    return removed
+
+
+storage_cli = AppGroup('storage', help='Attachment storage maintenance.')
+
+
+@storage_cli.command('gc')
+@click.option('--grace-hours', default=24, show_default=True,
+              help='Only remove data unreferenced for at least this long.')
+@click.option('--recount/--no-recount', 'do_recount', default=True, show_default=True,
+              help='Recompute reference counts from the attachment columns first.')
+@click.option('--dry-run', is_flag=True, help='List what would be removed.')
+def gc_command(grace_hours, do_recount, dry_run):
+    """Remove unreferenced blobs and abandoned uploads."""
+    if do_recount and not dry_run:
+        recount()
+    removed = collect_garbage(timedelta(hours=grace_hours), dry_run=dry_run)
+    for path in removed:
+        click.echo(path)
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {len(removed)} files.")
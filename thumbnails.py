@@ -0,0 +1,162 @@
+"""Downscaled previews of image and PDF attachments.
+
+A preview is a JPEG stored next to its attachment as ``<file>.thumb.jpg``
+(so content-addressed blobs share one preview) and is generated by an
+``attachments.thumbnail`` job queued when a reply or message with an
+attachment is saved. Images need Pillow; PDF first pages need poppler's
+``pdftoppm``. Without them attachments simply show no preview. Decoding,
+resizing and ``pdftoppm`` run through an ``OffloadPool`` of
+``THUMBNAIL_WORKERS`` OS threads, so a job running in a web worker's
+green thread does not stall the eventlet hub.
+Previews of existing attachments can be built with
+``flask storage thumbnails``.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+
+import click
+from flask import current_app, send_file
+from sqlalchemy import event, union
+
+from app import db
+from instrumentation import LATENCY_BUCKETS, registry
+from jobs import enqueue, job
+from models import Message, TicketReply
+from offload import OffloadPool
+from storage import PREVIEW_SUFFIX, resolve_path, storage_cli
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+PDF_EXTENSIONS = {'pdf'}
+PDFTOPPM_TIMEOUT = 30
+
+preview_pool = OffloadPool(wait=registry.histogram(
+    'thumbnail_wait_seconds', 'Time spent queued for a preview rendering slot.', (), LATENCY_BUCKETS))
+registry.gauge('thumbnail_queue', 'Preview renderings by state.', preview_pool.samples)
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def _pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def can_preview(filename):
+    extension = _extension(filename or '')
+    if extension in IMAGE_EXTENSIONS:
+        return _pillow() is not None
+    if extension in PDF_EXTENSIONS:
+        return shutil.which('pdftoppm') is not None
+    return False
+
+
+def thumbnail_path(filename):
+    path = resolve_path(filename)
+    return path + PREVIEW_SUFFIX if path else None
+
+
+def has_thumbnail(filename):
+    path = thumbnail_path(filename) if filename else None
+    return bool(path) and os.path.isfile(path)
+
+
+def _write_image(source, target, size, quality):
+    Image = _pillow()
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError as exc:
+        raise ValueError(str(exc))
+    with image:
+        # JPEG decoders can downscale while decoding, which is much cheaper
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(target, 'JPEG', quality=quality, optimize=True)
+
+
+def _write_pdf_page(source, target, size):
+    with tempfile.TemporaryDirectory() as workdir:
+        prefix = os.path.join(workdir, 'page')
+        subprocess.run(['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-jpeg', '-scale-to', str(size),
+                        source, prefix], check=True, timeout=PDFTOPPM_TIMEOUT, capture_output=True)
+        shutil.move(prefix + '.jpg', target)
+
+
+def generate(filename):
+    """Write the preview for ``filename`` unless it exists; return its path or None."""
+    if not can_preview(filename):
+        return None
+    source = resolve_path(filename)
+    if source is None or not os.path.isfile(source):
+        return None
+    target = source + PREVIEW_SUFFIX
+    if os.path.isfile(target):
+        return target
+    config = current_app.config
+    temp_path = f'{target}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    preview_pool.configure(config['THUMBNAIL_WORKERS'])
+    try:
+        if _extension(filename) in PDF_EXTENSIONS:
+            preview_pool.run(_write_pdf_page, source, temp_path, config['THUMBNAIL_SIZE'])
+        else:
+            preview_pool.run(_write_image, source, temp_path, config['THUMBNAIL_SIZE'], config['THUMBNAIL_QUALITY'])
+        os.replace(temp_path, target)
+    except (OSError, ValueError, subprocess.SubprocessError) as exc:
+        # Corrupt or unsupported files get no preview; retrying would not help.
+        current_app.logger.info('No preview for %s: %s', filename, exc)
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return target
+
+
+def send_thumbnail(filename):
+    """Serve a preview; previews never change, so clients may keep them for good."""
+    response = send_file(thumbnail_path(filename), mimetype='image/jpeg', conditional=True,
+                         max_age=current_app.config['THUMBNAIL_MAX_AGE'])
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+@job('attachments.thumbnail')
+def thumbnail_job(filename):
+    generate(filename)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _queue_thumbnails(session, flush_context, instances):
+    for obj in session.new:
+        if isinstance(obj, (TicketReply, Message)) and obj.attachment and can_preview(obj.attachment) \
+                and not has_thumbnail(obj.attachment):
+            enqueue('attachments.thumbnail', filename=obj.attachment)
+
+
+@storage_cli.command('thumbnails')
+def thumbnails_command():
+    """Generate missing previews for existing attachments."""
+    names = db.session.execute(union(
+        db.select(TicketReply.attachment).where(TicketReply.attachment.isnot(None)),
+        db.select(Message.attachment).where(Message.attachment.isnot(None)),
+    )).scalars()
+    created = 0
+    for name in names:
+        if can_preview(name) and not has_thumbnail(name) and generate(name):
+            created += 1
+    click.echo(f"Generated {created} previews.")
@@ -1,16 +1,34 @@
-import os
-import uuid
-from werkzeug.utils import secure_filename
+import base64
+import binascii
+from datetime import datetime
+
 from config import Config
+from storage import store_stream, claim_upload
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 def save_file(file_storage):
     if file_storage and allowed_file(file_storage.filename):
-        filename = secure_filename(file_storage.filename)
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        filepath = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-        file_storage.save(filepath)
-        return unique_filename
+        return store_stream(file_storage.stream, file_storage.filename)
     return None
+
+def form_attachment(form, user_id):
+    """Attachment name from the form's file field or a finished resumable upload."""
+    if form.attachment.data:
+        return save_file(form.attachment.data)
+    return claim_upload(form.upload_id.data, user_id)
+
+def encode_cursor(timestamp, row_id):
+    """Opaque keyset cursor for a (timestamp, id) position."""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) pair a cursor points at, or raise ValueError."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc